@@ -0,0 +1,93 @@
+"""
+Measure throughput of server.py for a growing number of worker processes.
+
+    poetry run python benchmark.py --workers 1 2 4 8 --duration 10 --clients 8
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess  # nosec B404
+import sys
+import time
+
+import httpx
+import jwt
+
+TOKEN = jwt.encode(
+    {"cognito:username": "bench@builder.com"}, "benchmark-secret-key-of-32-bytes"
+)
+
+
+def wait_until_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health-check/").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+
+def generate_load(base_url, path, duration, results):
+    completed = 0
+    with httpx.Client(base_url=base_url, headers={"Authorization": TOKEN}) as client:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            if client.get(path).status_code == 200:
+                completed += 1
+    results.put(completed)
+
+
+def measure(workers, port, path, duration, clients):
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        SERVER_WORKERS=str(workers),
+        SERVER_PORT=str(port),
+        STORAGE_BACKEND=os.getenv("STORAGE_BACKEND", "memory"),
+    )
+    server = subprocess.Popen([sys.executable, "server.py"], env=env)  # nosec B603
+    try:
+        wait_until_ready(base_url)
+        results = multiprocessing.Queue()
+        load = [
+            multiprocessing.Process(
+                target=generate_load, args=(base_url, path, duration, results)
+            )
+            for _ in range(clients)
+        ]
+        for process in load:
+            process.start()
+        completed = sum(results.get() for _ in load)
+        for process in load:
+            process.join()
+        return completed / duration
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/api/open-tasks/")
+    args = parser.parse_args()
+
+    print(f"cpus={os.cpu_count()} clients={args.clients} duration={args.duration}s")
+    baseline = None
+    for workers in args.workers:
+        throughput = measure(workers, args.port, args.path, args.duration, args.clients)
+        baseline = baseline or throughput
+        print(
+            f"workers={workers} requests/s={throughput:.0f} "
+            f"speedup={throughput / baseline:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
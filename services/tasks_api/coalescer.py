@@ -0,0 +1,282 @@
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from helpers import get_dynamodb_resource
+from resilience import ServiceUnavailableError
+
+MAX_BATCH_WRITE_ITEMS = 25  # DynamoDB BatchWriteItem hard limit
+MAX_UNPROCESSED_RETRIES = 5
+PUT_TIMEOUT_WINDOWS = 4
+BATCH_CALL_TIMEOUT_SECONDS = (
+    5  # allowance for one BatchWriteItem call including call guard retries
+)
+
+
+def _item_key(item):
+    return item["PK"], item["SK"]
+
+
+def _unprocessed_backoff(attempt):
+    return min(0.01 * 2**attempt, 0.5)
+
+
+UNPROCESSED_RETRY_SECONDS = sum(
+    _unprocessed_backoff(attempt) for attempt in range(1, MAX_UNPROCESSED_RETRIES + 1)
+)
+
+
+class _PendingWrite:
+    def __init__(self, item):
+        self.item = item
+        self.key = _item_key(item)
+        self.queued_at = time.monotonic()
+        self.future = Future()
+
+
+class WriteCoalescer:
+    """
+    Buffer put requests for a short window and flush them as concurrent BatchWriteItem calls
+    """
+
+    def __init__(
+        self,
+        table_name,
+        dynamodb_url=None,
+        window_ms=5,
+        max_batch_size=MAX_BATCH_WRITE_ITEMS,
+        call_guard=None,
+        max_concurrent_batches=10,
+        put_timeout=None,
+    ):
+        self.table_name = table_name
+        self.call_guard = call_guard
+        self.dynamodb_url = dynamodb_url
+        self.window = window_ms / 1000
+        self.max_batch_size = min(max_batch_size, MAX_BATCH_WRITE_ITEMS)
+        self.max_concurrent_batches = max_concurrent_batches
+        # Seconds put waits for its batch, so a stuck flush cannot hold request threads forever
+        self.put_timeout = (
+            put_timeout
+            if put_timeout is not None
+            else PUT_TIMEOUT_WINDOWS * self.window
+            + UNPROCESSED_RETRY_SECONDS
+            + BATCH_CALL_TIMEOUT_SECONDS
+        )
+        self.batches_written = 0
+        self._pending = []
+        self._in_flight_keys = set()
+        self._batches_in_flight = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        # The background thread only collects batches, the executor sends them. The default of 10 senders
+        # matches botocore's default max_pool_connections, more would only queue for a connection.
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_batches,
+            thread_name_prefix=f"write-coalescer-{table_name}",
+        )
+        self._thread = threading.Thread(
+            target=self._run, name=f"write-coalescer-{table_name}", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, item, timeout=None):
+        """
+        Queue item and block until it is durably written, at most put_timeout seconds by default
+        """
+        future = self.submit(item)
+        try:
+            return future.result(
+                timeout=timeout if timeout is not None else self.put_timeout
+            )
+        except FutureTimeoutError as err:
+            raise ServiceUnavailableError(
+                "Write coalescer did not flush in time", retry_after=1
+            ) from err
+
+    def submit(self, item):
+        """
+        Queue item and return future which is resolved once the item is written
+        """
+        pending_write = _PendingWrite(item)
+        with self._condition:
+            if self._closed or not self._thread.is_alive():
+                raise RuntimeError("Write coalescer is closed")
+            self._pending.append(pending_write)
+            self._condition.notify_all()
+        return pending_write.future
+
+    def close(self):
+        """
+        Flush buffered items and stop background thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    batch = self._wait_for_batch()
+                if batch is None:
+                    return  # Closed and nothing left to flush
+                try:
+                    self._executor.submit(self._write_batch, batch)
+                except RuntimeError:
+                    # Executor is shut down before atexit handlers run, flush the rest here
+                    self._write_batch(batch)
+        except BaseException:
+            # Without this thread nothing resolves pending futures, fail them and refuse new items
+            with self._condition:
+                self._closed = True
+                pending, self._pending = self._pending, []
+            for pending_write in pending:
+                pending_write.future.set_exception(
+                    RuntimeError("Write coalescer stopped unexpectedly")
+                )
+            raise
+
+    def _wait_for_batch(self):
+        """
+        Wait until a batch is due and a sender is free, return None once closed and drained
+        """
+        while not self._sendable():
+            if self._closed and not self._pending and not self._batches_in_flight:
+                return None
+            self._condition.wait()
+        # Window starts when the oldest write was queued. While other batches are in flight writes
+        # pile up anyway, so a free sender takes them at once instead of adding the window to every write.
+        deadline = self._pending[0].queued_at + self.window
+        while (
+            len(self._pending) < self.max_batch_size
+            and not self._closed
+            and not self._batches_in_flight
+        ):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._condition.wait(remaining)
+        self._batches_in_flight += 1
+        return self._take_batch()
+
+    def _sendable(self):
+        return self._batches_in_flight < self.max_concurrent_batches and any(
+            pending_write.key not in self._in_flight_keys
+            for pending_write in self._pending
+        )
+
+    def _take_batch(self):
+        """
+        Take up to max_batch_size writes without duplicate or in flight keys from the buffer
+        """
+        batch, rest = [], []
+        for pending_write in self._pending:
+            # BatchWriteItem rejects two requests for the same key in one call and concurrent
+            # batches could land in any order, so later writes of a task wait for the earlier one.
+            if (
+                len(batch) < self.max_batch_size
+                and pending_write.key not in self._in_flight_keys
+            ):
+                batch.append(pending_write)
+                self._in_flight_keys.add(pending_write.key)
+            else:
+                rest.append(pending_write)
+        self._pending = rest
+        return batch
+
+    def _write_batch(self, batch):
+        unprocessed = {pending_write.key: pending_write for pending_write in batch}
+        try:
+            dynamodb = get_dynamodb_resource(
+                dynamodb_url=self.dynamodb_url,
+                config=(
+                    self.call_guard.botocore_config()
+                    if self.call_guard is not None
+                    else None
+                ),
+            )  # high level dynomodb instance, reused across requests
+            for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+                if attempt > 0:
+                    # Sleeps on a sender thread, the collecting thread keeps batching other writes
+                    time.sleep(_unprocessed_backoff(attempt))
+                response = self._call(
+                    dynamodb.batch_write_item,
+                    RequestItems={
+                        self.table_name: [
+                            {"PutRequest": {"Item": pending_write.item}}
+                            for pending_write in unprocessed.values()
+                        ]
+                    },
+                )
+                # Items DynamoDB could not write (e.g. throttled) are returned in UnprocessedItems
+                # and must be resent; everything else in the request is durable now.
+                retry_keys = {
+                    _item_key(request["PutRequest"]["Item"])
+                    for request in response.get("UnprocessedItems", {}).get(
+                        self.table_name, []
+                    )
+                }
+                for key in list(unprocessed):
+                    if key not in retry_keys:
+                        unprocessed.pop(key).future.set_result(None)
+                if not unprocessed:
+                    break
+            # DynamoDB leaves items unprocessed when it throttles, same 503 as other throttled calls
+            error = ServiceUnavailableError(
+                "Item was not processed by BatchWriteItem", retry_after=1
+            )
+        except Exception as err:
+            error = err
+        finally:
+            with self._condition:
+                self.batches_written += 1
+                self._batches_in_flight -= 1
+                self._in_flight_keys.difference_update(
+                    pending_write.key for pending_write in batch
+                )
+                self._condition.notify_all()
+
+        for pending_write in unprocessed.values():
+            pending_write.future.set_exception(error)
+
+    def _call(self, operation, **kwargs):
+        if self.call_guard is None:
+            return operation(**kwargs)
+        return self.call_guard.call(operation, **kwargs)
+
+
+_coalescers = {}
+_coalescers_lock = threading.Lock()
+
+
+def get_write_coalescer(
+    table_name,
+    dynamodb_url=None,
+    window_ms=5,
+    max_batch_size=25,
+    max_concurrent_batches=10,
+    call_guard=None,
+):
+    """
+    Return write coalescer shared by every request of the current worker process
+    """
+    key = (os.getpid(), table_name, dynamodb_url)  # forked workers get their own thread
+    with _coalescers_lock:
+        if key not in _coalescers:
+            coalescer = WriteCoalescer(
+                table_name,
+                dynamodb_url=dynamodb_url,
+                window_ms=window_ms,
+                max_batch_size=max_batch_size,
+                call_guard=call_guard,
+                max_concurrent_batches=max_concurrent_batches,
+            )
+            atexit.register(coalescer.close)
+            _coalescers[key] = coalescer
+        return _coalescers[key]
@@ -1,8 +1,45 @@
-from typing import Optional
+from typing import Dict, Literal, Optional, Tuple
 
 from pydantic_settings import BaseSettings
 
 
 class Config(BaseSettings):
+    STORAGE_BACKEND: Literal["dynamodb", "memory", "sqlite"] = "dynamodb"
+    SQLITE_PATH: str = "tasks.db"
     TABLE_NAME: str = ""
     DYNAMODB_URL: Optional[str] = None
+    WRITE_COALESCING_ENABLED: bool = False
+    WRITE_COALESCING_WINDOW_MS: int = 5
+    WRITE_COALESCING_MAX_BATCH_SIZE: int = 25
+    WRITE_COALESCING_MAX_CONCURRENT_BATCHES: int = 10
+    DYNAMODB_RETRY_MODE: str = "adaptive"
+    DYNAMODB_MAX_ATTEMPTS: int = 3
+    DYNAMODB_BACKOFF_BASE_MS: int = 25
+    DYNAMODB_BACKOFF_MAX_MS: int = 1000
+    DYNAMODB_RETRY_BUDGET_TOKENS: int = 20
+    DYNAMODB_RETRY_BUDGET_REFILL: float = 0.1
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_BREAKER_FAILURE_RATE: float = 0.5
+    CIRCUIT_BREAKER_MINIMUM_CALLS: int = 20
+    CIRCUIT_BREAKER_WINDOW_SECONDS: float = 10
+    CIRCUIT_BREAKER_RESET_SECONDS: float = 5
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.01
+    PROFILING_SLOW_REQUEST_MS: Optional[float] = 1000
+    PROFILING_INTERVAL_MS: float = 5
+    PROFILING_OUTPUT_DIR: Optional[str] = None
+    SERVER_HOST: str = "127.0.0.1"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 1
+    SERVER_LIMIT_CONCURRENCY: Optional[int] = None
+    SERVER_BACKLOG: int = 2048
+    SERVER_THREADPOOL_SIZE: int = 40
+    SERVER_TIMEOUT_KEEP_ALIVE: int = 5
+    SERVER_ACCESS_LOG: bool = False
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_BACKEND: Literal["memory", "dynamodb"] = "memory"
+    # Endpoint name -> (requests per second, burst) for every owner
+    RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+        "create_task": (5, 20),
+        "open_tasks": (10, 40),
+    }
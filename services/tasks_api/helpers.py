@@ -1,23 +1,74 @@
 import os
+import threading
 
 import boto3
+from botocore.config import Config as BotocoreConfig
 
 dynamodb_url = os.getenv("DYNAMODB_URL")
 table_name = os.getenv("TABLE_NAME")
 
 
 def create_aws_service_instance(
-    name: str, access_type: str, region: str = "us-east-1", dynamodb_url: str = None
+    name: str,
+    access_type: str,
+    region: str = "us-east-1",
+    dynamodb_url: str = None,
+    config: BotocoreConfig = None,
 ):
     if access_type == "client":
         # For mock testing
         return boto3.client(
-            service_name=name, region_name=region, endpoint_url=dynamodb_url
+            service_name=name,
+            region_name=region,
+            endpoint_url=dynamodb_url,
+            config=config,
         )
     elif access_type == "resource":
         # For non mocking process
         return boto3.resource(
-            service_name=name, region_name=region, endpoint_url=dynamodb_url
+            service_name=name,
+            region_name=region,
+            endpoint_url=dynamodb_url,
+            config=config,
         )
     else:
         raise ValueError("Invalid access_type. Must be 'client' or 'resource'.")
+
+
+_dynamodb_resources = threading.local()
+_dynamodb_resources_lock = threading.Lock()
+
+
+def _config_key(config: BotocoreConfig = None):
+    """
+    Hashable value of every botocore config option, so resources differing in any option are not shared
+    """
+    if config is None:
+        return None
+    return tuple(
+        (name, repr(getattr(config, name))) for name in BotocoreConfig.OPTION_DEFAULTS
+    )
+
+
+def get_dynamodb_resource(dynamodb_url: str = None, config: BotocoreConfig = None):
+    """
+    Return dynamodb resource shared by every request handled by the current thread of the worker process.
+
+    Creating a resource opens a new connection pool, which costs more than most DynamoDB calls, so it is done
+    once per thread (and again after fork) and its connections are reused. Resources are not thread safe,
+    so threads do not share them; the service model is loaded once per process by the default boto3 session.
+    """
+    key = (os.getpid(), dynamodb_url, _config_key(config))
+    resources = getattr(_dynamodb_resources, "by_key", None)
+    if resources is None:
+        resources = _dynamodb_resources.by_key = {}
+    if key not in resources:
+        # The default boto3 session used to create resources is not thread safe either
+        with _dynamodb_resources_lock:
+            resources[key] = create_aws_service_instance(
+                name="dynamodb",
+                access_type="resource",
+                dynamodb_url=dynamodb_url,
+                config=config,
+            )
+    return resources[key]
@@ -1,18 +1,30 @@
+import math
 import uuid
-from typing import Dict, Union
+from typing import Dict, Optional, Union
 
 import jwt
-from fastapi import Depends, FastAPI, Header
+from fastapi import Depends, FastAPI, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from mangum import Mangum
 from starlette import status
 
+from coalescer import get_write_coalescer
 from config import Config
+from memory_store import get_memory_task_store
 from models import Task
+from profiling import ProfiledRoute, ProfilingMiddleware, TimedTaskStore, timed
+from ratelimit import RateLimiter, RateLimitExceeded
+from ratelimit import get_rate_limiter as create_rate_limiter
+from resilience import ServiceUnavailableError, get_call_guard
 from schemas import APITask, APITaskList, CloseTask, CreateTask
-from store import TaskStore
+from sqlite_store import get_sqlite_task_store
+from store import BaseTaskStore, TaskStore, TransactionConflictError
+
+config = Config()
 
 app = FastAPI(title="Task Management")
+app.router.route_class = ProfiledRoute
 app.add_middleware(
     CORSMiddleware,
     allow_origins="*",
@@ -20,18 +32,101 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if config.PROFILING_ENABLED:
+    app.add_middleware(
+        ProfilingMiddleware,
+        sample_rate=config.PROFILING_SAMPLE_RATE,
+        slow_request_ms=config.PROFILING_SLOW_REQUEST_MS,
+        interval_ms=config.PROFILING_INTERVAL_MS,
+        output_dir=config.PROFILING_OUTPUT_DIR,
+    )
+
+
+def get_task_store() -> BaseTaskStore:
+    with timed("dependency.get_task_store"):
+        task_store = _create_task_store()
+    if config.PROFILING_ENABLED:
+        return TimedTaskStore(task_store)
+    return task_store
+
+
+def _create_task_store() -> BaseTaskStore:
+    if config.STORAGE_BACKEND == "memory":
+        return get_memory_task_store()
+    if config.STORAGE_BACKEND == "sqlite":
+        return get_sqlite_task_store(config.SQLITE_PATH)
+
+    call_guard = get_call_guard(config)
+    write_coalescer = None
+    if config.WRITE_COALESCING_ENABLED:
+        write_coalescer = get_write_coalescer(
+            table_name=config.TABLE_NAME,
+            dynamodb_url=config.DYNAMODB_URL,
+            window_ms=config.WRITE_COALESCING_WINDOW_MS,
+            max_batch_size=config.WRITE_COALESCING_MAX_BATCH_SIZE,
+            max_concurrent_batches=config.WRITE_COALESCING_MAX_CONCURRENT_BATCHES,
+            call_guard=call_guard,
+        )
+    return TaskStore(
+        table_name=config.TABLE_NAME,
+        dynamodb_url=config.DYNAMODB_URL,
+        write_coalescer=write_coalescer,
+        call_guard=call_guard,
+    )
 
-config = Config()
 
+def get_user_email(authorization: Union[str, None] = Header(default=None)) -> str:
+    with timed("dependency.get_user_email"):
+        return jwt.decode(authorization, options={"verify_signature": False})[
+            "cognito:username"
+        ]  # Username equal to Email
 
-def get_task_store() -> TaskStore:
-    return TaskStore(table_name=config.TABLE_NAME, dynamodb_url=config.DYNAMODB_URL)
 
+def get_rate_limiter() -> Optional[RateLimiter]:
+    if not config.RATE_LIMIT_ENABLED:
+        return None
+    return create_rate_limiter(config)
+
+
+def rate_limited(endpoint: str):
+    """
+    Dependency which spends one token of the caller's bucket for endpoint
+    """
+
+    def check_rate_limit(
+        user_email: str = Depends(get_user_email),
+        rate_limiter: Optional[RateLimiter] = Depends(get_rate_limiter),
+    ) -> None:
+        if rate_limiter is not None:
+            rate_limiter.check(owner=user_email, endpoint=endpoint)
+
+    return check_rate_limit
 
-def get_user_email(authorization: Union[str, None] = Header(default=None)) -> str:
-    return jwt.decode(authorization, options={"verify_signature": False})[
-        "cognito:username"
-    ]  # Username equal to Email
+
+@app.exception_handler(RateLimitExceeded)
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(TransactionConflictError)
+def transaction_conflict_handler(request: Request, exc: TransactionConflictError):
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": str(exc), "reasons": exc.reasons},
+    )
+
+
+@app.exception_handler(ServiceUnavailableError)
+def service_unavailable_handler(request: Request, exc: ServiceUnavailableError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
 
 
 @app.get("/api/health-check/")
@@ -40,22 +135,29 @@ def health_check() -> Dict[str, str]:
 
 
 @app.post(
-    "/api/create-task/", response_model=APITask, status_code=status.HTTP_201_CREATED
+    "/api/create-task/",
+    response_model=APITask,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limited("create_task"))],
 )
 def create_task(
     parameters: CreateTask,
     user_email: str = Depends(get_user_email),
-    task_store: TaskStore = Depends(get_task_store),
+    task_store: BaseTaskStore = Depends(get_task_store),
 ):
     task = Task.create(uuid.uuid4(), title=parameters.title, owner=user_email)
     task_store.add(task)
     return task
 
 
-@app.get("/api/open-tasks/", response_model=APITaskList)
+@app.get(
+    "/api/open-tasks/",
+    response_model=APITaskList,
+    dependencies=[Depends(rate_limited("open_tasks"))],
+)
 def open_tasks(
     user_email: str = Depends(get_user_email),
-    task_store: TaskStore = Depends(get_task_store),
+    task_store: BaseTaskStore = Depends(get_task_store),
 ):
     open_tasks = task_store.list_open(owner=user_email)
     if len(open_tasks) > 0:
@@ -63,11 +165,15 @@ def open_tasks(
     return APITaskList(results=open_tasks)
 
 
-@app.post("/api/close-task/", response_model=APITask)
+@app.post(
+    "/api/close-task/",
+    response_model=APITask,
+    dependencies=[Depends(rate_limited("close_task"))],
+)
 def close_task(
     parameters: CloseTask,
     user_email: str = Depends(get_user_email),
-    task_store: TaskStore = Depends(get_task_store),
+    task_store: BaseTaskStore = Depends(get_task_store),
 ):
     task = task_store.get_by_id(task_id=parameters.id, owner=user_email)
     task.close()
@@ -75,10 +181,14 @@ def close_task(
     return task
 
 
-@app.get("/api/closed-tasks/", response_model=APITaskList)
+@app.get(
+    "/api/closed-tasks/",
+    response_model=APITaskList,
+    dependencies=[Depends(rate_limited("closed_tasks"))],
+)
 def closed_tasks(
     user_email: str = Depends(get_user_email),
-    task_store: TaskStore = Depends(get_task_store),
+    task_store: BaseTaskStore = Depends(get_task_store),
 ):
     return APITaskList(results=task_store.list_closed(owner=user_email))
 
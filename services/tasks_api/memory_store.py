@@ -0,0 +1,91 @@
+import dataclasses
+import os
+import threading
+from collections import OrderedDict
+
+from store import BaseTaskStore, TransactionConflictError
+
+
+class InMemoryTaskStore(BaseTaskStore):
+    """
+    Task store kept in process memory, indexed by owner and status
+    """
+
+    def __init__(self):
+        self._tasks = {}  # (owner, id) -> task
+        self._by_owner_status = (
+            {}
+        )  # (owner, status) -> ids ordered by time of last write
+        self._lock = threading.Lock()
+
+    def add(self, task):
+        """
+        Create item in memory
+        """
+        task = dataclasses.replace(task)  # Callers keep mutating their own instance
+        with self._lock:
+            self._put(task)
+
+    def _put(self, task):
+        previous = self._tasks.get((task.owner, task.id))
+        if previous is not None:
+            self._by_owner_status[(previous.owner, previous.status)].pop(task.id)
+        self._tasks[(task.owner, task.id)] = task
+        self._by_owner_status.setdefault((task.owner, task.status), OrderedDict())[
+            task.id
+        ] = None
+
+    def _commit(self, operations):
+        """
+        Check every condition first and apply operations only if all of them hold
+        """
+        with self._lock:
+            reasons = [
+                "None"
+                if operation.condition_holds(self._tasks.get(operation.key))
+                else "ConditionalCheckFailed"
+                for operation in operations
+            ]
+            if any(reason != "None" for reason in reasons):
+                raise TransactionConflictError("Transaction cancelled", reasons)
+            for operation in operations:
+                if operation.action == "put":
+                    self._put(dataclasses.replace(operation.task))
+                elif operation.action == "update_status":
+                    self._put(
+                        dataclasses.replace(
+                            self._tasks[operation.key], status=operation.status
+                        )
+                    )
+
+    def get_by_id(self, task_id, owner):
+        """
+        Get single item from memory
+        """
+        with self._lock:
+            return dataclasses.replace(self._tasks[(owner, task_id)])
+
+    def _list_by_status(self, owner, status):
+        """
+        List task for specific status
+        """
+        with self._lock:
+            return [
+                dataclasses.replace(self._tasks[(owner, task_id)])
+                for task_id in self._by_owner_status.get((owner, status), ())
+            ]
+
+
+_memory_stores = {}
+_memory_stores_lock = threading.Lock()
+
+
+def get_memory_task_store():
+    """
+    Return in-memory task store of the current worker process
+    """
+    pid = os.getpid()
+    with _memory_stores_lock:
+        if pid not in _memory_stores:
+            _memory_stores[pid] = InMemoryTaskStore()
+        return _memory_stores[pid]
@@ -0,0 +1,376 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from fastapi.routing import APIRoute
+from starlette.background import BackgroundTask
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from store import Transaction
+
+logger = logging.getLogger("tasks_api.profiling")
+
+MAX_STACK_DEPTH = 128
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    """
+    Timing breakdown and stack samples of a single request
+    """
+
+    def __init__(self, method, path, capture_stacks):
+        self.method = method
+        self.path = path
+        self.capture_stacks = capture_stacks
+        self.started_at = time.perf_counter()
+        self.duration = None
+        self.endpoint_finished_at = None
+        self.timings = collections.defaultdict(float)  # name -> seconds
+        self.calls = collections.Counter()  # name -> number of calls
+        self.samples = (
+            collections.Counter()
+        )  # stack of code objects -> number of samples
+        self._active_threads = collections.Counter()  # thread id -> nesting depth
+        self._lock = threading.Lock()
+
+    def add_timing(self, name, seconds):
+        with self._lock:
+            self.timings[name] += seconds
+            self.calls[name] += 1
+
+    def enter_thread(self):
+        with self._lock:
+            self._active_threads[threading.get_ident()] += 1
+
+    def exit_thread(self):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active_threads[thread_id] -= 1
+            if self._active_threads[thread_id] <= 0:
+                del self._active_threads[thread_id]
+
+    def sample(self, frames):
+        """
+        Record stacks of threads currently working on this request
+        """
+        with self._lock:
+            thread_ids = list(self._active_threads)
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            if frame is not None:
+                stack = _capture_stack(frame)
+                with self._lock:
+                    self.samples[stack] += 1
+
+    def folded(self):
+        """
+        Stack samples in collapsed format understood by flamegraph.pl and speedscope
+        """
+        return "".join(
+            f"{_collapse_stack(stack)} {count}\n"
+            for stack, count in self.samples.items()
+        )
+
+    def summary(self):
+        return {
+            "method": self.method,
+            "path": self.path,
+            "duration_ms": round(self.duration * 1000, 3),
+            "timings_ms": {
+                name: round(seconds * 1000, 3) for name, seconds in self.timings.items()
+            },
+            "calls": dict(self.calls),
+            "samples": sum(self.samples.values()),
+        }
+
+
+def _capture_stack(frame):
+    # Runs while holding the GIL on every sample, labels are only built when the profile is written
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(frame.f_code)
+        frame = frame.f_back
+    return tuple(stack)
+
+
+def _collapse_stack(stack):
+    return ";".join(_code_label(code) for code in reversed(stack))
+
+
+@functools.lru_cache(maxsize=4096)
+def _code_label(code):
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def current_profile():
+    return _current_profile.get()
+
+
+@contextlib.contextmanager
+def timed(name):
+    """
+    Add duration of the block to the profile of the current request, if any
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.enter_thread()
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_timing(name, time.perf_counter() - started_at)
+        profile.exit_thread()
+
+
+class StackSampler:
+    """
+    Background thread which periodically samples stacks of profiled requests
+    """
+
+    def __init__(self, interval_ms=5):
+        self.interval = interval_ms / 1000
+        self._profiles = {}  # profile -> monotonic time its sampling starts
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread_pid = None
+
+    def register(self, profile, delay=0):
+        """
+        Sample stacks of profile once it has been registered for `delay` seconds
+        """
+        with self._lock:
+            self._profiles[profile] = time.monotonic() + delay
+            if self._thread_pid != os.getpid():  # threads do not survive fork
+                self._thread_pid = os.getpid()
+                threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                ).start()
+        self._wakeup.set()
+
+    def unregister(self, profile):
+        with self._lock:
+            self._profiles.pop(profile, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                profiles = [
+                    profile
+                    for profile, starts_at in self._profiles.items()
+                    if starts_at <= now
+                ]
+                next_start = min(
+                    (
+                        starts_at
+                        for starts_at in self._profiles.values()
+                        if starts_at > now
+                    ),
+                    default=None,
+                )
+            if not profiles:
+                # Requests finishing before their sampling starts are never walked
+                self._wakeup.wait(None if next_start is None else next_start - now)
+                self._wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.sample(frames)
+            time.sleep(self.interval)
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """
+    Profile sampled and slow requests and write their timing breakdown and stack samples once the response is sent
+    """
+
+    def __init__(
+        self,
+        app,
+        sample_rate=0.01,
+        slow_request_ms=None,
+        interval_ms=5,
+        output_dir=None,
+    ):
+        super().__init__(app)
+        self.sample_rate = sample_rate
+        self.slow_request_ms = slow_request_ms
+        self.output_dir = output_dir
+        self.sampler = StackSampler(interval_ms=interval_ms)
+
+    async def dispatch(self, request, call_next):
+        sampled = random.random() < self.sample_rate  # nosec B311
+        capture_stacks = sampled or self.slow_request_ms is not None
+        profile = RequestProfile(
+            request.method, request.url.path, capture_stacks=capture_stacks
+        )
+        token = _current_profile.set(profile)
+        if capture_stacks:
+            profile.enter_thread()
+            # Slowness is only known at the end, so requests which are not sampled get their stacks
+            # sampled once they have run for half the threshold instead of from the start
+            self.sampler.register(
+                profile, delay=0 if sampled else self.slow_request_ms / 2000
+            )
+        try:
+            response = await call_next(request)
+        finally:
+            if capture_stacks:
+                self.sampler.unregister(profile)
+                profile.exit_thread()
+            _current_profile.reset(token)
+            profile.duration = time.perf_counter() - profile.started_at
+        slow = (
+            self.slow_request_ms is not None
+            and profile.duration * 1000 >= self.slow_request_ms
+        )
+        if sampled or slow:
+            # Written in a thread after the response is sent, so the request is not slowed down further.
+            # Responses of call_next carry no background task of their own.
+            response.background = BackgroundTask(self.write, profile, slow=slow)
+        return response
+
+    def write(self, profile, slow):
+        """
+        Write or log profile, errors are logged so profiling never fails a request
+        """
+        try:
+            self._write(profile, slow)
+        except Exception:
+            logger.exception(
+                "Profile of %s %s could not be written", profile.method, profile.path
+            )
+
+    def _write(self, profile, slow):
+        summary = profile.summary()
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            name = "{}-{}-{}-{}".format(
+                int(time.time() * 1000),
+                profile.method,
+                re.sub(r"[^A-Za-z0-9]+", "_", profile.path).strip("_"),
+                uuid.uuid4().hex[:8],
+            )
+            base_path = os.path.join(self.output_dir, name)
+            with open(f"{base_path}.folded", "w") as folded_file:
+                folded_file.write(profile.folded())
+            with open(f"{base_path}.json", "w") as summary_file:
+                json.dump(summary, summary_file, indent=2)
+            summary["profile"] = f"{base_path}.folded"
+        else:
+            summary["folded"] = profile.folded()
+        logger.warning(
+            "%s request %s %s took %.1f ms: %s",
+            "Slow" if slow else "Sampled",
+            profile.method,
+            profile.path,
+            profile.duration * 1000,
+            json.dumps(summary),
+        )
+
+
+class ProfiledRoute(APIRoute):
+    """
+    Route which reports endpoint and response serialisation time to the request profile
+    """
+
+    def get_route_handler(self):
+        self.dependant.call = _timed_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request):
+            response = await handler(request)
+            profile = _current_profile.get()
+            if profile is not None and profile.endpoint_finished_at is not None:
+                profile.add_timing(
+                    "serialize_response",
+                    time.perf_counter() - profile.endpoint_finished_at,
+                )
+            return response
+
+        return profiled_handler
+
+
+def _timed_endpoint(endpoint):
+    if getattr(endpoint, "__profiled__", False):
+        return endpoint
+
+    def finish(profile, started_at):
+        profile.endpoint_finished_at = time.perf_counter()
+        profile.add_timing("endpoint", profile.endpoint_finished_at - started_at)
+
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            profile = _current_profile.get()
+            started_at = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    finish(profile, started_at)
+
+    else:
+
+        @functools.wraps(endpoint)
+        def timed_endpoint(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return endpoint(*args, **kwargs)
+            profile.enter_thread()  # sync endpoints run in a threadpool thread
+            started_at = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                finish(profile, started_at)
+                profile.exit_thread()
+
+    timed_endpoint.__profiled__ = True
+    return timed_endpoint
+
+
+class TimedTaskStore:
+    """
+    Task store proxy which reports duration of every store call to the request profile
+    """
+
+    def __init__(self, task_store):
+        self._task_store = task_store
+
+    def transaction(self):
+        # Bound to the proxy, so committing the transaction is timed as well
+        return Transaction(self)
+
+    def _commit(self, operations):
+        with timed("store.transaction"):
+            return self._task_store._commit(operations)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._task_store, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+
+        @functools.wraps(attribute)
+        def timed_call(*args, **kwargs):
+            with timed(f"store.{name}"):
+                return attribute(*args, **kwargs)
+
+        return timed_call
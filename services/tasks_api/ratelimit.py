@@ -0,0 +1,220 @@
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from helpers import get_dynamodb_resource
+from resilience import ServiceUnavailableError, get_call_guard
+
+logger = logging.getLogger("tasks_api.ratelimit")
+
+MAX_CONDITIONAL_WRITE_RETRIES = 3
+UNAVAILABLE_WARNING_INTERVAL_SECONDS = 60
+
+
+class RateLimitExceeded(Exception):
+    """
+    Owner used up the token bucket of an endpoint
+    """
+
+    def __init__(self, owner, endpoint, retry_after):
+        super().__init__(f"Rate limit of {endpoint} exceeded")
+        self.owner = owner
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+def refill(tokens, updated_at, now, rate, burst):
+    """
+    Tokens in bucket at `now`, bucket holds at most `burst` tokens and gains `rate` tokens per second
+    """
+    return min(burst, tokens + max(0, now - updated_at) * rate)
+
+
+def take_token(tokens, rate):
+    """
+    Return tokens left after taking one and seconds to wait if none was available
+    """
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+class InMemoryRateLimitBackend:
+    """
+    Token buckets kept in memory of the current worker process
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def acquire(self, key, rate, burst):
+        """
+        Take one token from bucket, return seconds to wait if bucket is empty, otherwise 0
+        """
+        with self._lock:
+            now = self.clock()
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens, retry_after = take_token(
+                refill(tokens, updated_at, now, rate, burst), rate
+            )
+            self._buckets[key] = (tokens, now)
+            return retry_after
+
+
+class DynamoDBRateLimitBackend:
+    """
+    Token buckets shared by every worker, stored in the tasks table with optimistic locking
+    """
+
+    def __init__(self, table_name, dynamodb_url=None, call_guard=None, clock=time.time):
+        self.table_name = table_name
+        self.dynamodb_url = dynamodb_url
+        self.call_guard = call_guard
+        self.clock = clock
+
+    def acquire(self, key, rate, burst):
+        """
+        Take one token from bucket, return seconds to wait if bucket is empty, otherwise 0
+        """
+        table = get_dynamodb_resource(
+            dynamodb_url=self.dynamodb_url,
+            config=(
+                self.call_guard.botocore_config()
+                if self.call_guard is not None
+                else None
+            ),
+        ).Table(self.table_name)
+        item_key = {"PK": f"#RATELIMIT#{key[0]}", "SK": f"#{key[1]}"}
+        for _ in range(MAX_CONDITIONAL_WRITE_RETRIES):
+            record = self._call(table.get_item, Key=item_key, ConsistentRead=True).get(
+                "Item"
+            )
+            now = Decimal(str(self.clock()))
+            if record is None:
+                tokens, condition = Decimal(burst), "attribute_not_exists(PK)"
+                values = {}
+            else:
+                tokens = refill(
+                    record["tokens"],
+                    record["updated_at"],
+                    now,
+                    Decimal(str(rate)),
+                    Decimal(burst),
+                )
+                condition = "updated_at = :previous"
+                values = {":previous": record["updated_at"]}
+            tokens, retry_after = take_token(tokens, Decimal(str(rate)))
+            seconds_to_full = (Decimal(burst) - tokens) / Decimal(str(rate))
+            try:
+                self._call(
+                    table.put_item,
+                    Item={
+                        **item_key,
+                        "tokens": tokens,
+                        "updated_at": now,
+                        # Bucket is full again afterwards, so DynamoDB TTL may delete the item
+                        "expires_at": int(now + seconds_to_full) + 1,
+                    },
+                    ConditionExpression=condition,
+                    **({"ExpressionAttributeValues": values} if values else {}),
+                )
+                return float(retry_after)
+            except ClientError as err:
+                if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+                # Another worker updated the bucket in between, read it again
+        # Contention says nothing about the tokens left, let the request through rather than reject it
+        logger.warning("Rate limit bucket %s is contended, not limited", key)
+        return 0
+
+    def _call(self, operation, **kwargs):
+        """
+        Run dynomodb operation through retry policy and circuit breaker if configured
+        """
+        if self.call_guard is None:
+            return operation(**kwargs)
+        return self.call_guard.call(operation, **kwargs)
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiting per owner and endpoint
+    """
+
+    def __init__(self, backend, limits, clock=time.monotonic):
+        self.backend = backend
+        self.limits = limits  # endpoint -> (tokens per second, burst)
+        self.clock = clock
+        self._last_unavailable_warning = None
+        self._suppressed_unavailable_warnings = 0
+        self._warning_lock = threading.Lock()
+
+    def check(self, owner, endpoint):
+        """
+        Raise RateLimitExceeded if owner has no token left for endpoint
+        """
+        if endpoint not in self.limits:
+            return
+        rate, burst = self.limits[endpoint]
+        try:
+            retry_after = self.backend.acquire((owner, endpoint), rate, burst)
+        except ServiceUnavailableError as err:
+            # Raised on every request while the circuit is open, so warn once per interval without traceback
+            self._warn_unavailable(endpoint, err)
+            return
+        except (BotoCoreError, ClientError):
+            # Rate limiting must not take the API down with it, fail open
+            logger.exception("Rate limit of %s could not be checked", endpoint)
+            return
+        if retry_after > 0:
+            raise RateLimitExceeded(owner, endpoint, retry_after)
+
+    def _warn_unavailable(self, endpoint, err):
+        with self._warning_lock:
+            now = self.clock()
+            if (
+                self._last_unavailable_warning is not None
+                and now - self._last_unavailable_warning
+                < UNAVAILABLE_WARNING_INTERVAL_SECONDS
+            ):
+                self._suppressed_unavailable_warnings += 1
+                return
+            suppressed = self._suppressed_unavailable_warnings
+            self._last_unavailable_warning = now
+            self._suppressed_unavailable_warnings = 0
+        logger.warning(
+            "Rate limit of %s not checked, requests are let through: %s "
+            "(%d similar warnings suppressed)",
+            endpoint,
+            err,
+            suppressed,
+        )
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(config):
+    """
+    Return rate limiter shared by every request of the current worker process
+    """
+    pid = os.getpid()
+    with _rate_limiters_lock:
+        if pid not in _rate_limiters:
+            if config.RATE_LIMIT_BACKEND == "dynamodb":
+                backend = DynamoDBRateLimitBackend(
+                    table_name=config.TABLE_NAME,
+                    dynamodb_url=config.DYNAMODB_URL,
+                    call_guard=get_call_guard(config),
+                )
+            else:
+                backend = InMemoryRateLimitBackend()
+            _rate_limiters[pid] = RateLimiter(backend, config.RATE_LIMITS)
+        return _rate_limiters[pid]
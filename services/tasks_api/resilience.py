@@ -0,0 +1,271 @@
+import collections
+import os
+import random
+import threading
+import time
+
+from botocore.config import Config as BotocoreConfig
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+THROTTLING_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "InternalServerError",
+    "ServiceUnavailable",
+}
+CONNECTION_ERRORS = (ConnectionClosedError, EndpointConnectionError, ReadTimeoutError)
+
+
+class ServiceUnavailableError(Exception):
+    """
+    DynamoDB is overloaded or unreachable, request should be retried later
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_transient_error(err):
+    """
+    Check whether error is caused by throttling or an unhealthy DynamoDB endpoint
+    """
+    if isinstance(err, ClientError):
+        return err.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+    return isinstance(err, CONNECTION_ERRORS)
+
+
+class RetryPolicy:
+    """
+    Capped exponential backoff with full jitter, limited by a retry budget
+    """
+
+    def __init__(
+        self,
+        max_attempts=3,
+        base_delay_ms=25,
+        max_delay_ms=1000,
+        budget_tokens=20,
+        budget_refill_per_success=0.1,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self.budget_tokens = budget_tokens
+        self.budget_refill_per_success = budget_refill_per_success
+        self._tokens = float(budget_tokens)
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt):
+        """
+        Delay in seconds before given retry attempt (1 = first retry)
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def acquire_retry(self):
+        """
+        Take one token from retry budget, False if budget is exhausted
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._tokens = min(
+                self.budget_tokens, self._tokens + self.budget_refill_per_success
+            )
+
+
+class CircuitBreaker:
+    """
+    Open circuit when failure rate within sliding window exceeds threshold
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_rate_threshold=0.5,
+        minimum_calls=20,
+        window_seconds=10,
+        reset_timeout_seconds=5,
+        clock=time.monotonic,
+    ):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.window_seconds = window_seconds
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._calls = collections.deque()  # (timestamp, failed)
+        self._lock = threading.Lock()
+
+    @property
+    def retry_after(self):
+        """
+        Seconds until circuit allows a probe request again
+        """
+        if self.state != self.OPEN:
+            return 0
+        return max(0, self.reset_timeout_seconds - (self.clock() - self._opened_at))
+
+    def before_call(self):
+        """
+        Raise ServiceUnavailableError if calls are currently shed
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout_seconds:
+                    raise ServiceUnavailableError(
+                        "DynamoDB circuit breaker is open", self.retry_after
+                    )
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise ServiceUnavailableError(
+                        "DynamoDB circuit breaker is half open",
+                        self.reset_timeout_seconds,
+                    )
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._close()
+                return
+            self._record(failed=False)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+                return
+            self._record(failed=True)
+            failures = sum(failed for _, failed in self._calls)
+            if (
+                len(self._calls) >= self.minimum_calls
+                and failures / len(self._calls) >= self.failure_rate_threshold
+            ):
+                self._open()
+
+    def _record(self, failed):
+        now = self.clock()
+        self._calls.append((now, failed))
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = self.clock()
+        self._probe_in_flight = False
+        self._calls.clear()
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._calls.clear()
+
+
+class DynamoDBCallGuard:
+    """
+    Run DynamoDB calls through retry policy and circuit breaker
+    """
+
+    def __init__(
+        self,
+        retry_policy=None,
+        circuit_breaker=None,
+        retry_mode="adaptive",
+        sleep=time.sleep,
+    ):
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.retry_mode = retry_mode
+        self.sleep = sleep
+
+    def botocore_config(self):
+        """
+        Botocore client config; retries are done by the guard so botocore makes one attempt,
+        adaptive mode still rate limits the client on throttling responses
+        """
+        return BotocoreConfig(
+            retries={"mode": self.retry_mode, "total_max_attempts": 1}
+        )
+
+    def call(self, operation, *args, **kwargs):
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_call()
+            try:
+                result = operation(*args, **kwargs)
+            except Exception as err:
+                if not is_transient_error(err):
+                    # Client side errors (validation, conditions) say nothing about table health
+                    if self.circuit_breaker is not None:
+                        self.circuit_breaker.record_success()
+                    raise
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure()
+                attempt += 1
+                if (
+                    attempt >= self.retry_policy.max_attempts
+                    or not self.retry_policy.acquire_retry()
+                ):
+                    raise ServiceUnavailableError(
+                        "DynamoDB is throttling requests",
+                        retry_after=max(1, self.retry_policy.max_delay),
+                    ) from err
+                self.sleep(self.retry_policy.backoff(attempt))
+            else:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_success()
+                self.retry_policy.record_success()
+                return result
+
+
+_call_guards = {}
+_call_guards_lock = threading.Lock()
+
+
+def get_call_guard(config):
+    """
+    Return call guard shared by every request of the current worker process
+    """
+    with _call_guards_lock:
+        pid = os.getpid()  # forked workers keep their own breaker state
+        if pid not in _call_guards:
+            circuit_breaker = None
+            if config.CIRCUIT_BREAKER_ENABLED:
+                circuit_breaker = CircuitBreaker(
+                    failure_rate_threshold=config.CIRCUIT_BREAKER_FAILURE_RATE,
+                    minimum_calls=config.CIRCUIT_BREAKER_MINIMUM_CALLS,
+                    window_seconds=config.CIRCUIT_BREAKER_WINDOW_SECONDS,
+                    reset_timeout_seconds=config.CIRCUIT_BREAKER_RESET_SECONDS,
+                )
+            _call_guards[pid] = DynamoDBCallGuard(
+                retry_policy=RetryPolicy(
+                    max_attempts=config.DYNAMODB_MAX_ATTEMPTS,
+                    base_delay_ms=config.DYNAMODB_BACKOFF_BASE_MS,
+                    max_delay_ms=config.DYNAMODB_BACKOFF_MAX_MS,
+                    budget_tokens=config.DYNAMODB_RETRY_BUDGET_TOKENS,
+                    budget_refill_per_success=config.DYNAMODB_RETRY_BUDGET_REFILL,
+                ),
+                circuit_breaker=circuit_breaker,
+                retry_mode=config.DYNAMODB_RETRY_MODE,
+            )
+        return _call_guards[pid]
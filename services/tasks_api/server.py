@@ -0,0 +1,192 @@
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import anyio.to_thread
+import uvicorn
+from uvicorn.main import STARTUP_FAILURE
+
+from config import Config
+
+# Imported before fork so every worker shares the already loaded application code
+from main import app, get_task_store
+
+logger = logging.getLogger("tasks_api.server")
+
+config = Config()
+
+# Workers exiting sooner than this after they were started count as failing at startup
+WORKER_MIN_UPTIME_SECONDS = 5
+MAX_RESPAWN_DELAY_SECONDS = 30
+MAX_RAPID_WORKER_FAILURES = 5
+
+
+def create_socket(host, port, backlog):
+    """
+    Create listening socket which is inherited by every worker
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def set_threadpool_size():
+    """
+    Limit number of sync endpoints running at the same time in a worker
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = config.SERVER_THREADPOOL_SIZE
+
+
+def warm_up_worker():
+    """
+    Create storage connections of this worker before it accepts requests
+    """
+    try:
+        get_task_store().warm_up()
+    except Exception:
+        logger.exception("Worker %s could not warm up task store", os.getpid())
+
+
+def serve(sock):
+    """
+    Serve requests on the socket until stopped, return False if the app failed to start
+    """
+    warm_up_worker()
+    server = uvicorn.Server(
+        uvicorn.Config(
+            app,
+            limit_concurrency=config.SERVER_LIMIT_CONCURRENCY,  # 503 once exceeded
+            backlog=config.SERVER_BACKLOG,
+            timeout_keep_alive=config.SERVER_TIMEOUT_KEEP_ALIVE,
+            access_log=config.SERVER_ACCESS_LOG,
+        )
+    )
+    server.run(sockets=[sock])
+    return server.started
+
+
+def respawn_delay(rapid_failures):
+    """
+    Seconds to wait before replacing a worker after `rapid_failures` workers in a row exited right after start
+    """
+    if rapid_failures == 0:
+        return 0
+    return min(MAX_RESPAWN_DELAY_SECONDS, 2 ** (rapid_failures - 1))
+
+
+def spawn_worker(sock):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        exit_code = 1
+        try:
+            exit_code = 0 if serve(sock) else STARTUP_FAILURE
+        except SystemExit as err:
+            exit_code = err.code if isinstance(err.code, int) else 1
+        except BaseException:
+            logger.exception("Worker %s crashed", os.getpid())
+        finally:
+            # os._exit skips atexit handlers and buffered output of the forked copy of the master
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+    return pid
+
+
+class WorkerSupervisor:
+    """
+    Keep SERVER_WORKERS workers running, back off and give up when they keep exiting right after start
+    """
+
+    def __init__(self, sock, worker_count):
+        self.sock = sock
+        self.worker_count = worker_count
+        self.workers = {}  # pid -> time the worker was started
+        self.stopping = False
+        self.exit_code = 0
+        self.rapid_failures = 0
+
+    def spawn(self):
+        self.workers[spawn_worker(self.sock)] = time.monotonic()
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+
+    def run(self):
+        for _ in range(self.worker_count):
+            self.spawn()
+        while self.workers:
+            try:
+                pid, wait_status = os.wait()
+            except ChildProcessError:
+                break
+            started_at = self.workers.pop(pid, None)
+            if not self.stopping and started_at is not None:
+                self.replace(pid, wait_status, started_at)
+        return self.exit_code
+
+    def replace(self, pid, wait_status, started_at):
+        if time.monotonic() - started_at < WORKER_MIN_UPTIME_SECONDS:
+            self.rapid_failures += 1
+        else:
+            self.rapid_failures = 0
+        if self.rapid_failures >= MAX_RAPID_WORKER_FAILURES:
+            logger.error(
+                "%s workers in a row exited right after start, shutting down",
+                self.rapid_failures,
+            )
+            self.exit_code = 1
+            self.stop()
+            return
+        delay = respawn_delay(self.rapid_failures)
+        logger.warning(
+            "Worker %s exited with status %s, starting a new one in %s s",
+            pid,
+            os.waitstatus_to_exitcode(wait_status),
+            delay,
+        )
+        deadline = time.monotonic() + delay
+        # Short sleeps so a stop signal is not held up by the backoff
+        while not self.stopping and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if not self.stopping:
+            self.spawn()
+
+
+def run():
+    """
+    Serve the app with SERVER_WORKERS forked worker processes sharing one socket
+    """
+    app.add_event_handler("startup", set_threadpool_size)
+    sock = create_socket(config.SERVER_HOST, config.SERVER_PORT, config.SERVER_BACKLOG)
+    if config.SERVER_WORKERS <= 1:
+        return 0 if serve(sock) else STARTUP_FAILURE
+
+    supervisor = WorkerSupervisor(sock, config.SERVER_WORKERS)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    logger.info(
+        "Serving on %s:%s with %s workers",
+        config.SERVER_HOST,
+        config.SERVER_PORT,
+        config.SERVER_WORKERS,
+    )
+    try:
+        return supervisor.run()
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(run())
@@ -0,0 +1,147 @@
+import datetime
+import os
+import sqlite3
+import threading
+from uuid import UUID
+
+from models import Task, TaskStatus
+from store import BaseTaskStore, TransactionConflictError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    owner TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (owner, id)
+);
+CREATE INDEX IF NOT EXISTS tasks_owner_status_updated_at
+    ON tasks (owner, status, updated_at);
+"""
+
+
+class SQLiteTaskStore(BaseTaskStore):
+    """
+    Task store kept in a SQLite database file
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        # Requests run in a threadpool, the lock serialises access to the shared connection
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            if path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+
+    def add(self, task):
+        """
+        Create item on sqlite
+        """
+        with self._lock, self._connection:
+            self._put(task)
+
+    def _put(self, task):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO tasks (owner, id, title, status, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                task.owner,
+                str(task.id),
+                task.title,
+                task.status.value,
+                datetime.datetime.utcnow().isoformat(),
+            ),
+        )
+
+    def _commit(self, operations):
+        """
+        Check conditions and apply operations in one immediate SQLite transaction
+        """
+        with self._lock:
+            # IMMEDIATE takes the write lock up front so other workers cannot change checked rows
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                reasons = [
+                    "None"
+                    if operation.condition_holds(
+                        self._get(operation.task_id, operation.owner)
+                    )
+                    else "ConditionalCheckFailed"
+                    for operation in operations
+                ]
+                if any(reason != "None" for reason in reasons):
+                    raise TransactionConflictError("Transaction cancelled", reasons)
+                for operation in operations:
+                    if operation.action == "put":
+                        self._put(operation.task)
+                    elif operation.action == "update_status":
+                        self._connection.execute(
+                            "UPDATE tasks SET status = ?, updated_at = ? WHERE owner = ? AND id = ?",
+                            (
+                                operation.status.value,
+                                datetime.datetime.utcnow().isoformat(),
+                                operation.owner,
+                                str(operation.task_id),
+                            ),
+                        )
+            except BaseException:
+                self._connection.rollback()
+                raise
+            self._connection.commit()
+
+    def get_by_id(self, task_id, owner):
+        """
+        Get single item from sqlite
+        """
+        with self._lock:
+            task = self._get(task_id, owner)
+        if task is None:
+            raise KeyError(task_id)
+        return task
+
+    def _get(self, task_id, owner):
+        row = self._connection.execute(
+            "SELECT id, title, status, owner FROM tasks WHERE owner = ? AND id = ?",
+            (owner, str(task_id)),
+        ).fetchone()
+        return None if row is None else self._to_task(row)
+
+    def _list_by_status(self, owner, status):
+        """
+        List task for specific status
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, title, status, owner FROM tasks "
+                "WHERE owner = ? AND status = ? ORDER BY updated_at, rowid",
+                (owner, status.value),
+            ).fetchall()
+        return [self._to_task(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def _to_task(row):
+        return Task(
+            id=UUID(row[0]), title=row[1], status=TaskStatus[row[2]], owner=row[3]
+        )
+
+
+_sqlite_stores = {}
+_sqlite_stores_lock = threading.Lock()
+
+
+def get_sqlite_task_store(path):
+    """
+    Return SQLite task store of the current worker process
+    """
+    key = (os.getpid(), path)  # sqlite connections must not be shared across fork
+    with _sqlite_stores_lock:
+        if key not in _sqlite_stores:
+            _sqlite_stores[key] = SQLiteTaskStore(path)
+        return _sqlite_stores[key]
@@ -1,61 +1,147 @@
+import dataclasses
 import datetime
-from uuid import UUID
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+from uuid import UUID, uuid4
 
 from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 
-from helpers import create_aws_service_instance
+from helpers import get_dynamodb_resource
 from models import Task, TaskStatus
+from resilience import ServiceUnavailableError
 
+MAX_TRANSACTION_ITEMS = 100  # DynamoDB TransactWriteItems limit
+THROTTLING_CANCELLATION_CODES = {"ProvisionedThroughputExceeded", "ThrottlingError"}
 
-class TaskStore:
-    def __init__(self, table_name, dynamodb_url=None):
-        self.table_name = table_name
-        self.dynamodb_url = dynamodb_url
 
-    def add(self, task):
+class TransactionConflictError(Exception):
+    """
+    Transaction was cancelled because a condition failed or its items were changed concurrently
+    """
+
+    def __init__(self, message, reasons):
+        super().__init__(message)
+        self.reasons = (
+            reasons  # cancellation reason code per operation, "None" if not the cause
+        )
+
+
+@dataclass
+class TransactionOperation:
+    action: str  # "put", "update_status" or "condition_check"
+    owner: str
+    task_id: UUID
+    task: Optional[Task] = None
+    status: Optional[TaskStatus] = None
+    expected_status: Optional[TaskStatus] = None
+    must_exist: Optional[bool] = None
+
+    @property
+    def key(self):
+        return self.owner, self.task_id
+
+    def condition_holds(self, current):
         """
-        Create item on dynomodb
+        Check operation condition against current version of the task (None if it does not exist)
         """
-        dynamodb = create_aws_service_instance(
-            name="dynamodb", access_type="resource", dynamodb_url=self.dynamodb_url
-        )  # high level dynomodb instance createion
+        if self.must_exist is True and current is None:
+            return False
+        if self.must_exist is False and current is not None:
+            return False
+        if self.expected_status is not None:
+            return current is not None and current.status == self.expected_status
+        return True
 
-        table = dynamodb.Table(
-            self.table_name
-        )  # get specific table on dynomo db cluster
-        table.put_item(
-            Item={
-                "PK": f"#{task.owner}",  # Partion key
-                "SK": f"#{task.id}",  # Sort key
-                "GS1PK": f"#{task.owner}#{task.status.value}",
-                "GS1SK": f"#{datetime.datetime.utcnow().isoformat()}",
-                "id": str(task.id),
-                "title": task.title,
-                "status": task.status.value,
-                "owner": task.owner,
-            }
-        )
 
-    def get_by_id(self, task_id, owner):
+class Transaction:
+    """
+    Operations collected within `with store.transaction()` and committed together on exit
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.operations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None and self.operations:
+            self.store._commit(self.operations)
+        return False
+
+    def put(self, task, expected_status=None, must_exist=None):
         """
-        Get single item from dynomodb
+        Create or replace task if the current version matches the conditions
         """
-        dynamodb = create_aws_service_instance(
-            name="dynamodb", access_type="resource", dynamodb_url=self.dynamodb_url
-        )  # high level dynomodb instance createion
+        self._append(
+            TransactionOperation(
+                "put",
+                task.owner,
+                task.id,
+                task=dataclasses.replace(task),
+                expected_status=expected_status,
+                must_exist=must_exist,
+            )
+        )
 
-        table = dynamodb.Table(
-            self.table_name
-        )  # get specific table on dynomo db cluster
-        record = table.get_item(Key={"PK": f"#{owner}", "SK": f"#{task_id}"})
+    def update_status(self, task_id, owner, status, expected_status=None):
+        """
+        Move existing task to status, optionally only from expected_status
+        """
+        self._append(
+            TransactionOperation(
+                "update_status",
+                owner,
+                task_id,
+                status=status,
+                expected_status=expected_status,
+                must_exist=True,
+            )
+        )
 
-        return Task(
-            id=UUID(record["Item"]["id"]),
-            title=record["Item"]["title"],
-            owner=record["Item"]["owner"],
-            status=TaskStatus[record["Item"]["status"]],
+    def condition_check(self, task_id, owner, expected_status=None, must_exist=True):
+        """
+        Cancel transaction unless task matches the conditions, without changing it
+        """
+        if expected_status is None and must_exist is None:
+            raise ValueError("Condition check needs expected_status or must_exist")
+        self._append(
+            TransactionOperation(
+                "condition_check",
+                owner,
+                task_id,
+                expected_status=expected_status,
+                must_exist=must_exist,
+            )
         )
 
+    def _append(self, operation):
+        # DynamoDB rejects transactions touching one item twice, so no backend allows it
+        if any(other.key == operation.key for other in self.operations):
+            raise ValueError(f"Task {operation.task_id} is already in the transaction")
+        self.operations.append(operation)
+
+
+class BaseTaskStore(ABC):
+    """
+    Storage backend interface used by the API
+    """
+
+    @abstractmethod
+    def add(self, task):
+        """
+        Create or replace task
+        """
+
+    @abstractmethod
+    def get_by_id(self, task_id, owner):
+        """
+        Get single task of owner, raise KeyError if it does not exist
+        """
+
     def list_open(self, owner):
         """
         List opened task for specific user and task status
@@ -68,45 +154,228 @@ class TaskStore:
         """
         return self._list_by_status(owner, TaskStatus.CLOSED)
 
+    @abstractmethod
     def _list_by_status(self, owner, status):
         """
-        List task for specific status
+        List task for specific status ordered by time of last write
+        """
+
+    def warm_up(self):
+        """
+        Prepare connections before the first request is served
+        """
+
+    def transaction(self):
+        """
+        Collect puts, status updates and condition checks which are committed together
+        """
+        return Transaction(self)
+
+    @abstractmethod
+    def _commit(self, operations):
+        """
+        Apply all operations or none, raise TransactionConflictError if a condition fails
+        """
+
+
+class TaskStore(BaseTaskStore):
+    def __init__(
+        self, table_name, dynamodb_url=None, write_coalescer=None, call_guard=None
+    ):
+        self.table_name = table_name
+        self.dynamodb_url = dynamodb_url
+        self.write_coalescer = write_coalescer
+        self.call_guard = call_guard
+
+    def add(self, task):
+        """
+        Create item on dynomodb
+        """
+        item = self._to_item(task)
+        if self.write_coalescer is not None:
+            # Returns only after the batch containing this item is written,
+            # raises ServiceUnavailableError if that takes longer than put_timeout
+            self.write_coalescer.put(item, timeout=self.write_coalescer.put_timeout)
+            return
+
+        table = self._table()
+        self._call(table.put_item, Item=item)
+
+    def warm_up(self):
+        """
+        Load table description so the connection to dynamodb is open before the first request
+        """
+        self._call(self._table().load)
+
+    def _commit(self, operations):
         """
-        dynamodb = create_aws_service_instance(
-            name="dynamodb", access_type="resource", dynamodb_url=self.dynamodb_url
-        )  # high level dynomodb instance createion
+        Commit operations with one TransactWriteItems call per MAX_TRANSACTION_ITEMS operations.
 
-        table = dynamodb.Table(self.table_name)
-        last_key = None
+        Every chunk is atomic on its own; if a later chunk is cancelled, the earlier ones stay committed.
+        """
+        client = self._table().meta.client
+        for offset in range(0, len(operations), MAX_TRANSACTION_ITEMS):
+            end = offset + MAX_TRANSACTION_ITEMS
+            chunk = operations[offset:end]
+            try:
+                self._call(
+                    client.transact_write_items,
+                    TransactItems=[self._to_transact_item(op) for op in chunk],
+                    # Same token on every retry, so a chunk committed before a timeout is not applied twice
+                    ClientRequestToken=str(uuid4()),
+                )
+            except ClientError as err:
+                if err.response["Error"]["Code"] != "TransactionCanceledException":
+                    raise
+                codes = [
+                    reason.get("Code", "None")
+                    for reason in err.response.get("CancellationReasons", [])
+                ]
+                if THROTTLING_CANCELLATION_CODES.intersection(codes):
+                    raise ServiceUnavailableError(
+                        "DynamoDB is throttling requests", retry_after=1
+                    ) from err
+                # DynamoDB returns one reason per item of the cancelled chunk
+                reasons = (
+                    ["None"] * offset
+                    + codes
+                    + ["None"] * (len(operations) - offset - len(codes))
+                )
+                raise TransactionConflictError(
+                    f"Transaction cancelled after {offset} committed operations",
+                    reasons,
+                ) from err
+
+    def _to_transact_item(self, operation):
+        """
+        Convert transaction operation to TransactWriteItems request item, values are serialized by the resource client
+        """
+        key = {"PK": f"#{operation.owner}", "SK": f"#{operation.task_id}"}
+        conditions, names, values = [], {}, {}
+        if operation.must_exist is True:
+            conditions.append("attribute_exists(PK)")
+        elif operation.must_exist is False:
+            conditions.append("attribute_not_exists(PK)")
+        if operation.expected_status is not None:
+            conditions.append("#status = :expected_status")
+            names["#status"] = "status"
+            values[":expected_status"] = operation.expected_status.value
+
+        if operation.action == "put":
+            action = "Put"
+            request = {"Item": self._to_item(operation.task)}
+        elif operation.action == "update_status":
+            action = "Update"
+            request = {
+                "Key": key,
+                "UpdateExpression": "SET #status = :status, GS1PK = :gs1pk, GS1SK = :gs1sk",
+            }
+            names["#status"] = "status"
+            values[":status"] = operation.status.value
+            values[":gs1pk"] = f"#{operation.owner}#{operation.status.value}"
+            values[":gs1sk"] = f"#{datetime.datetime.utcnow().isoformat()}"
+        else:
+            action = "ConditionCheck"
+            request = {"Key": key}
+
+        request["TableName"] = self.table_name
+        if conditions:
+            request["ConditionExpression"] = " AND ".join(conditions)
+        if names:
+            request["ExpressionAttributeNames"] = names
+        if values:
+            request["ExpressionAttributeValues"] = values
+        return {action: request}
+
+    def _table(self):
+        """
+        Get dynomodb table resource
+        """
+        dynamodb = get_dynamodb_resource(
+            dynamodb_url=self.dynamodb_url,
+            config=(
+                self.call_guard.botocore_config()
+                if self.call_guard is not None
+                else None
+            ),
+        )  # high level dynomodb instance, reused across requests
+
+        return dynamodb.Table(
+            self.table_name
+        )  # get specific table on dynomo db cluster
+
+    def _call(self, operation, **kwargs):
+        """
+        Run dynomodb operation through retry policy and circuit breaker if configured
+        """
+        if self.call_guard is None:
+            return operation(**kwargs)
+        return self.call_guard.call(operation, **kwargs)
+
+    @staticmethod
+    def _to_item(task):
+        """
+        Convert task to dynomodb item
+        """
+        return {
+            "PK": f"#{task.owner}",  # Partion key
+            "SK": f"#{task.id}",  # Sort key
+            "GS1PK": f"#{task.owner}#{task.status.value}",
+            "GS1SK": f"#{datetime.datetime.utcnow().isoformat()}",
+            "id": str(task.id),
+            "title": task.title,
+            "status": task.status.value,
+            "owner": task.owner,
+        }
+
+    def get_by_id(self, task_id, owner):
+        """
+        Get single item from dynomodb
+        """
+        table = self._table()
+        record = self._call(
+            table.get_item, Key={"PK": f"#{owner}", "SK": f"#{task_id}"}
+        )
+
+        return Task(
+            id=UUID(record["Item"]["id"]),
+            title=record["Item"]["title"],
+            owner=record["Item"]["owner"],
+            status=TaskStatus[record["Item"]["status"]],
+        )
+
+    def _list_by_status(self, owner, status):
+        """
+        List task for specific status
+        """
+        table = self._table()
         query_kwargs = {
             "IndexName": "GS1",
             "KeyConditionExpression": Key("GS1PK").eq(f"#{owner}#{status.value}"),
         }
         tasks = []
         while True:
-            if last_key is not None:
-                # To retrieve the next set of items.
-                # Y1ou can use the ExclusiveStartKey parameter in a subsequent request.
-                # The value of ExclusiveStartKey should be set to the LastEvaluatedKey from the previous response.
-                # This tells DynamoDB to start the next query or scan from that key.
-                query_kwargs["ExclusiveStartKey"] = last_key
-            else:
-                response = table.query(**query_kwargs)
-                tasks.extend(
-                    [
-                        Task(
-                            id=UUID(record["id"]),
-                            title=record["title"],
-                            owner=record["owner"],
-                            status=TaskStatus[record["status"]],
-                        )
-                        for record in response["Items"]
-                    ]
-                )
-                # The LastEvaluatedKey represents the key of the last item in the truncated result set.
-                # Once you've reached the end of the records, there's no LastEvaluatedKey in the response anymore.
-                # That's the time to exit the loop.
-                last_key = response.get("LastEvaluatedKey")
-                if last_key is None:
-                    break
+            response = self._call(table.query, **query_kwargs)
+            tasks.extend(
+                [
+                    Task(
+                        id=UUID(record["id"]),
+                        title=record["title"],
+                        owner=record["owner"],
+                        status=TaskStatus[record["status"]],
+                    )
+                    for record in response["Items"]
+                ]
+            )
+            # The LastEvaluatedKey represents the key of the last item in the truncated result set.
+            # Once you've reached the end of the records, there's no LastEvaluatedKey in the response anymore.
+            # That's the time to exit the loop.
+            last_key = response.get("LastEvaluatedKey")
+            if last_key is None:
+                break
+            # To retrieve the next set of items.
+            # You can use the ExclusiveStartKey parameter in a subsequent request.
+            # The value of ExclusiveStartKey should be set to the LastEvaluatedKey from the previous response.
+            # This tells DynamoDB to start the next query or scan from that key.
+            query_kwargs["ExclusiveStartKey"] = last_key
         return tasks
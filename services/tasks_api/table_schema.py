@@ -0,0 +1,36 @@
+"""
+Single table schema of the tasks API, mirrors resources/dynamodb.yml
+"""
+
+TABLE_DEFINITION = {
+    "AttributeDefinitions": [
+        {"AttributeName": "PK", "AttributeType": "S"},
+        {"AttributeName": "SK", "AttributeType": "S"},
+        {"AttributeName": "GS1PK", "AttributeType": "S"},
+        {"AttributeName": "GS1SK", "AttributeType": "S"},
+    ],
+    "KeySchema": [
+        {"AttributeName": "PK", "KeyType": "HASH"},
+        {"AttributeName": "SK", "KeyType": "RANGE"},
+    ],
+    "BillingMode": "PAY_PER_REQUEST",
+    "GlobalSecondaryIndexes": [
+        {
+            "IndexName": "GS1",
+            "KeySchema": [
+                {"AttributeName": "GS1PK", "KeyType": "HASH"},
+                {"AttributeName": "GS1SK", "KeyType": "RANGE"},
+            ],
+            "Projection": {
+                "ProjectionType": "ALL",
+            },
+        },
+    ],
+}
+
+
+def create_table(client, table_name):
+    """
+    Create tasks table with low level dynomodb client
+    """
+    return client.create_table(TableName=table_name, **TABLE_DEFINITION)
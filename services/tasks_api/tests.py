@@ -1,83 +1,318 @@
+import contextvars
+import json
+import os
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import jwt
 import pytest
-from fastapi import status
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config as BotocoreConfig
+from botocore.exceptions import ClientError
+from fastapi import FastAPI, status
 from moto import mock_dynamodb
 from starlette.testclient import TestClient
 
-from helpers import create_aws_service_instance
+from coalescer import MAX_UNPROCESSED_RETRIES, WriteCoalescer
+from helpers import create_aws_service_instance, get_dynamodb_resource
 from infrastructure.test_data_clear_dynomodb import TruncateTestData
 from infrastructure.test_data_initialize_dynomodb import TestDataInitialize
-from main import app, get_task_store
+from main import app, get_rate_limiter, get_task_store
+from memory_store import InMemoryTaskStore
 from models import Task, TaskStatus
+from profiling import (
+    ProfilingMiddleware,
+    RequestProfile,
+    StackSampler,
+    TimedTaskStore,
+    _current_profile,
+)
+from ratelimit import (
+    MAX_CONDITIONAL_WRITE_RETRIES,
+    UNAVAILABLE_WARNING_INTERVAL_SECONDS,
+    DynamoDBRateLimitBackend,
+    InMemoryRateLimitBackend,
+    RateLimiter,
+)
+from resilience import (
+    CircuitBreaker,
+    DynamoDBCallGuard,
+    RetryPolicy,
+    ServiceUnavailableError,
+)
+from server import MAX_RESPAWN_DELAY_SECONDS, respawn_delay
 from setup_env import load_env
-from store import TaskStore
+from sqlite_store import SQLiteTaskStore
+from store import MAX_TRANSACTION_ITEMS, TaskStore, TransactionConflictError
+from table_schema import create_table
 
 DEBUG = load_env(key="DEBUG", cast=bool)
 
+# Every pytest-xdist worker gets its own tables, "master" when running without xdist
+WORKER_ID = os.getenv("PYTEST_XDIST_WORKER", "master")
+TEST_TABLE_NAME = f"test-table-{WORKER_ID}"
+PERF_TABLE_NAME = f"perf-table-{WORKER_ID}"
+PERF_DATASET_SIZE = 2000
+PERF_OWNER = "perf@builder.com"
+SEED_TASKS = [
+    Task.create(uuid.UUID(int=index), f"Seed task {index}", "seed@builder.com")
+    for index in range(5)
+]
 
-@pytest.fixture
-def dynamodb_table():
+
+class TableSnapshot:
+    """
+    Items of a DynamoDB table captured once, restored after each test by undoing only what the test changed.
     """
-    Fixture: dynamodb_table
 
-    This fixture is used to create a mock DynamoDB table for testing purposes.
+    def __init__(self, table):
+        self.table = table
+        self.items = {}
+
+    def capture(self):
+        self.items = self._scan()
+
+    def restore(self):
+        current = self._scan()
+        with self.table.batch_writer() as batch:
+            for key, item in current.items():
+                if key not in self.items:
+                    batch.delete_item(Key=dict(zip(("PK", "SK"), key)))
+                elif item != self.items[key]:
+                    batch.put_item(Item=self.items[key])
+            for key, item in self.items.items():
+                if key not in current:
+                    batch.put_item(Item=item)
+
+    def _scan(self):
+        items, scan_kwargs = {}, {}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            items.update({(item["PK"], item["SK"]): item for item in response["Items"]})
+            if "LastEvaluatedKey" not in response:
+                return items
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+@pytest.fixture(scope="session")
+def dynamodb_client():
+    """
+    Fixture: dynamodb_client
+
+    This fixture starts one mock DynamoDB for the whole test session.
 
     Steps:
     1. Set up a mock DynamoDB instance for testing.
-    2. Create a low-level DynamoDB client instance.
-    3. Define the name of the DynamoDB table to be created.
-    4. Create the DynamoDB table with specific configurations.
-    5. Yield the table name for use within the test function.
+    2. Yield a low-level DynamoDB client instance.
     """
     with mock_dynamodb():
-        client = create_aws_service_instance(
+        yield create_aws_service_instance(
             "dynamodb", "client"
         )  # low level dynomo db instance creation
 
-        table_name = "test-table"
-        client.create_table(
-            AttributeDefinitions=[
-                {"AttributeName": "PK", "AttributeType": "S"},
-                {"AttributeName": "SK", "AttributeType": "S"},
-                {"AttributeName": "GS1PK", "AttributeType": "S"},
-                {"AttributeName": "GS1SK", "AttributeType": "S"},
-            ],
-            TableName=table_name,
-            KeySchema=[
-                {"AttributeName": "PK", "KeyType": "HASH"},
-                {"AttributeName": "SK", "KeyType": "RANGE"},
-            ],
-            BillingMode="PAY_PER_REQUEST",
-            GlobalSecondaryIndexes=[
+
+@pytest.fixture(scope="session")
+def dynamodb_snapshot(dynamodb_client):
+    """
+    Fixture: dynamodb_snapshot
+
+    This fixture creates the test table once per session (and per pytest-xdist worker) and captures its seed data.
+
+    Steps:
+    1. Create the DynamoDB table of this worker from the shared table schema.
+    2. Add the seed tasks to the table.
+    3. Capture the items of the table and return the snapshot.
+    """
+    create_table(dynamodb_client, TEST_TABLE_NAME)
+    repository = TaskStore(table_name=TEST_TABLE_NAME)
+    for task in SEED_TASKS:
+        repository.add(task)
+
+    snapshot = TableSnapshot(get_dynamodb_resource().Table(TEST_TABLE_NAME))
+    snapshot.capture()
+    return snapshot
+
+
+@pytest.fixture
+def dynamodb_table(dynamodb_snapshot):
+    """
+    Fixture: dynamodb_table
+
+    This fixture provides the seeded mock DynamoDB table and resets it after the test.
+
+    Steps:
+    1. Yield the table name for use within the test function.
+    2. Restore the table to the captured snapshot, which only touches items the test changed.
+    """
+    yield dynamodb_snapshot.table.name
+    dynamodb_snapshot.restore()
+
+
+@pytest.fixture(scope="session")
+def perf_dynamodb_table(dynamodb_client):
+    """
+    Fixture: perf_dynamodb_table
+
+    This fixture loads a large read-only dataset once per session for performance tests.
+
+    Steps:
+    1. Create the performance DynamoDB table of this worker from the shared table schema.
+    2. Write PERF_DATASET_SIZE tasks of one owner, every other one closed, with BatchWriteItem.
+    3. Return the table name. Tests must not modify this table.
+    """
+    create_table(dynamodb_client, PERF_TABLE_NAME)
+    with get_dynamodb_resource().Table(PERF_TABLE_NAME).batch_writer() as batch:
+        for index in range(PERF_DATASET_SIZE):
+            task = Task.create(uuid.uuid4(), f"Task {index}", PERF_OWNER)
+            if index % 2:
+                task.close()
+            batch.put_item(Item=TaskStore._to_item(task))
+    return PERF_TABLE_NAME
+
+
+@contextmanager
+def inject_dynamodb_faults(repository, operation, error_code, count):
+    """
+    Make the next `count` calls of a DynamoDB operation made by the repository fail with the given error code
+    before they reach moto.
+
+    Yields a dict whose "remaining" key tells how many injected faults were not consumed.
+    """
+    faults = {"remaining": count}
+
+    def raise_fault(**kwargs):
+        if faults["remaining"] > 0:
+            faults["remaining"] -= 1
+            return AWSResponse(
+                "https://dynamodb.us-east-1.amazonaws.com", 400, {}, None
+            ), {
+                "Error": {"Code": error_code, "Message": "Injected fault"},
+                "ResponseMetadata": {"HTTPStatusCode": 400},
+            }
+
+    # DynamoDB resources are cached per thread, so the repository is pinned to the table whose client
+    # events carry the faults, also for calls made from request threads
+    table = repository._table()
+    events = table.meta.client.meta.events
+    event_name = f"before-call.dynamodb.{operation}"
+    events.register(event_name, raise_fault)
+    repository._table = lambda: table
+    try:
+        yield faults
+    finally:
+        del repository._table
+        events.unregister(event_name, raise_fault)
+
+
+def create_profiled_client(task_store, **options):
+    """
+    Create a test client for the application routes wrapped in ProfilingMiddleware with the given options.
+    """
+    profiled_app = FastAPI()
+    profiled_app.include_router(app.router)
+    profiled_app.add_middleware(ProfilingMiddleware, **options)
+    profiled_app.dependency_overrides[get_task_store] = lambda: TimedTaskStore(
+        task_store
+    )
+    return TestClient(profiled_app)
+
+
+class SlowBatchWriteCoalescer(WriteCoalescer):
+    def __init__(self, *args, latency=0.05, **kwargs):
+        self.latency = latency
+        self.release = threading.Event()
+        self.release.set()
+        self.concurrent_calls = 0
+        self.peak_concurrent_calls = 0
+        self._calls_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def _call(self, operation, **kwargs):
+        with self._calls_lock:
+            self.concurrent_calls += 1
+            self.peak_concurrent_calls = max(
+                self.peak_concurrent_calls, self.concurrent_calls
+            )
+        try:
+            self.release.wait()
+            time.sleep(self.latency)
+            return super()._call(operation, **kwargs)
+        finally:
+            with self._calls_lock:
+                self.concurrent_calls -= 1
+
+
+class UnprocessedItemsCoalescer(WriteCoalescer):
+    """
+    Write coalescer whose BatchWriteItem stub returns the last `unprocessed_count` items as unprocessed
+    for the first `unprocessed_calls` calls and records which items were written.
+    """
+
+    def __init__(self, *args, unprocessed_count=1, unprocessed_calls=1, **kwargs):
+        self.unprocessed_count = unprocessed_count
+        self.unprocessed_calls = unprocessed_calls
+        self.requests = []
+        self.written_keys = set()
+        super().__init__(*args, **kwargs)
+
+    def _call(self, operation, **kwargs):
+        items = [
+            request["PutRequest"]["Item"]
+            for request in kwargs["RequestItems"][self.table_name]
+        ]
+        self.requests.append(items)
+        unprocessed = []
+        if len(self.requests) <= self.unprocessed_calls:
+            first_unprocessed = len(items) - self.unprocessed_count
+            unprocessed = items[first_unprocessed:]
+        for item in items:
+            if item not in unprocessed:
+                self.written_keys.add((item["PK"], item["SK"]))
+        return {
+            "UnprocessedItems": (
                 {
-                    "IndexName": "GS1",
-                    "KeySchema": [
-                        {"AttributeName": "GS1PK", "KeyType": "HASH"},
-                        {"AttributeName": "GS1SK", "KeyType": "RANGE"},
-                    ],
-                    "Projection": {
-                        "ProjectionType": "ALL",
-                    },
-                },
-            ],
-        )
-        yield table_name
+                    self.table_name: [
+                        {"PutRequest": {"Item": item}} for item in unprocessed
+                    ]
+                }
+                if unprocessed
+                else {}
+            )
+        }
+
+
+class BrokenWriteCoalescer(WriteCoalescer):
+    def _take_batch(self):
+        raise RuntimeError("Broken batch collection")
+
+
+class ConflictingTaskStore(InMemoryTaskStore):
+    def add(self, task):
+        with self.transaction() as transaction:
+            transaction.put(task, must_exist=True)
+
+
+class SlowTaskStore(InMemoryTaskStore):
+    def add(self, task):
+        time.sleep(0.05)
+        super().add(task)
 
 
 def setup():
     """
     Perform setup operations for initializing test data and create mock data for dynamodb for testing purpose.
     """
-    TestDataInitialize(debug=DEBUG)
+    TestDataInitialize(debug=DEBUG, table=TEST_TABLE_NAME)
 
 
 def clear():
     """
     Perform clear test data operations from localhost dynamodb for testing purpose.
     """
-    TruncateTestData(debug=DEBUG)
+    TruncateTestData(debug=DEBUG, table=TEST_TABLE_NAME)
 
 
 @pytest.fixture
@@ -95,6 +330,45 @@ def task_store(dynamodb_table):
     return TaskStore(dynamodb_table)
 
 
+@pytest.fixture(params=["dynamodb", "memory", "sqlite"])
+def any_task_store(request, tmp_path):
+    """
+    Fixture: any_task_store
+
+    This fixture provides every storage backend implementation so the same test runs against each of them.
+
+    Steps:
+    1. Read the backend name from the fixture parameter.
+    2. Create a TaskStore on the dynamodb_table fixture, an InMemoryTaskStore or a SQLiteTaskStore on a temporary file.
+    3. Yield the store instance.
+    """
+    if request.param == "dynamodb":
+        yield TaskStore(request.getfixturevalue("dynamodb_table"))
+    elif request.param == "memory":
+        yield InMemoryTaskStore()
+    else:
+        store = SQLiteTaskStore(str(tmp_path / "tasks.db"))
+        yield store
+        store.close()
+
+
+@pytest.fixture
+def write_coalescer(dynamodb_table):
+    """
+    Fixture: write_coalescer
+
+    This fixture creates a WriteCoalescer which batches writes into the dynamodb_table fixture.
+
+    Steps:
+    1. Create a WriteCoalescer with a wide flush window so concurrent writes end up in one batch.
+    2. Yield the WriteCoalescer instance.
+    3. Flush pending writes and stop the background thread.
+    """
+    write_coalescer = WriteCoalescer(dynamodb_table, window_ms=50)
+    yield write_coalescer
+    write_coalescer.close()
+
+
 @pytest.fixture
 def client(task_store):
     """
@@ -404,3 +678,1101 @@ def test_list_closed_tasks(client, user_email, id_token):
     assert body["results"][0]["owner"] == user_email
     assert body["results"][0]["status"] == TaskStatus.CLOSED
     clear()
+
+
+def test_coalesced_tasks_written_in_batches(dynamodb_table, write_coalescer):
+    """
+    Test function: test_coalesced_tasks_written_in_batches
+
+    This test function verifies that concurrently added tasks are coalesced into BatchWriteItem calls.
+
+    Steps:
+    1. Create an instance of the TaskStore repository which writes through the write_coalescer fixture.
+    2. Add ten tasks to the repository from concurrent threads.
+    3. Perform an assertion to check if every task can be retrieved by its ID once add returned.
+    4. Perform an assertion to check if fewer batches than tasks were written.
+    """
+    repository = TaskStore(table_name=dynamodb_table, write_coalescer=write_coalescer)
+    tasks = [
+        Task.create(uuid.uuid4(), f"Task {index}", "john@doe.com")
+        for index in range(10)
+    ]
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        list(executor.map(repository.add, tasks))
+
+    for task in tasks:
+        assert repository.get_by_id(task_id=task.id, owner=task.owner) == task
+    assert write_coalescer.batches_written < len(tasks)
+
+
+def test_coalesced_writes_of_same_task_keep_order(dynamodb_table, write_coalescer):
+    """
+    Test function: test_coalesced_writes_of_same_task_keep_order
+
+    This test function verifies that two buffered writes of the same task are not sent in one batch.
+
+    Steps:
+    1. Create an instance of the TaskStore repository which writes through the write_coalescer fixture.
+    2. Submit an open task and the same task closed to the write_coalescer without waiting.
+    3. Wait for both writes to finish.
+    4. Perform an assertion to check if the task retrieved by its ID is closed.
+    """
+    repository = TaskStore(table_name=dynamodb_table, write_coalescer=write_coalescer)
+    task = Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+    opened = write_coalescer.submit(repository._to_item(task))
+    task.close()
+    closed = write_coalescer.submit(repository._to_item(task))
+
+    opened.result()
+    closed.result()
+
+    assert repository.get_by_id(task_id=task.id, owner=task.owner).status == (
+        TaskStatus.CLOSED
+    )
+
+
+def test_coalesced_batches_sent_concurrently(dynamodb_table):
+    """
+    Test function: test_coalesced_batches_sent_concurrently
+
+    This test function verifies that batches are sent by several threads instead of one after another.
+
+    Steps:
+    1. Create a write coalescer with single item batches, four senders and 50 ms latency per BatchWriteItem call.
+    2. Add eight tasks to the repository from concurrent threads.
+    3. Perform an assertion to check if more than one BatchWriteItem call was in flight at once.
+    4. Perform an assertion to check if every task can be retrieved by its ID.
+    """
+    write_coalescer = SlowBatchWriteCoalescer(
+        dynamodb_table, window_ms=1, max_batch_size=1, max_concurrent_batches=4
+    )
+    repository = TaskStore(table_name=dynamodb_table, write_coalescer=write_coalescer)
+    tasks = [
+        Task.create(uuid.uuid4(), f"Task {index}", "john@doe.com") for index in range(8)
+    ]
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(repository.add, tasks))
+    finally:
+        write_coalescer.close()
+
+    assert write_coalescer.peak_concurrent_calls > 1
+    for task in tasks:
+        assert repository.get_by_id(task_id=task.id, owner=task.owner) == task
+
+
+def test_coalescer_put_times_out(dynamodb_table):
+    """
+    Test function: test_coalescer_put_times_out
+
+    This test function verifies that a write stuck in the coalescer does not block its caller forever.
+
+    Steps:
+    1. Create a write coalescer whose BatchWriteItem calls wait until released, with a 50 ms put timeout.
+    2. Perform an assertion to check if adding a task raises ServiceUnavailableError.
+    3. Release the call and close the coalescer.
+    """
+    write_coalescer = SlowBatchWriteCoalescer(
+        dynamodb_table, window_ms=1, latency=0, put_timeout=0.05
+    )
+    write_coalescer.release.clear()
+    repository = TaskStore(table_name=dynamodb_table, write_coalescer=write_coalescer)
+
+    try:
+        with pytest.raises(ServiceUnavailableError):
+            repository.add(
+                Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+            )
+    finally:
+        write_coalescer.release.set()
+        write_coalescer.close()
+
+
+def test_coalescer_survives_failed_flush(dynamodb_table, monkeypatch):
+    """
+    Test function: test_coalescer_survives_failed_flush
+
+    This test function verifies that an error while flushing fails only the writes of that batch.
+
+    Steps:
+    1. Create a write coalescer and make creating the DynamoDB resource fail.
+    2. Perform an assertion to check if putting an item raises the error.
+    3. Restore the DynamoDB resource factory.
+    4. Perform an assertion to check if the next task is written.
+    """
+    write_coalescer = WriteCoalescer(dynamodb_table, window_ms=1)
+    repository = TaskStore(table_name=dynamodb_table, write_coalescer=write_coalescer)
+
+    def broken_resource(**kwargs):
+        raise ValueError("No DynamoDB endpoint")
+
+    try:
+        monkeypatch.setattr("coalescer.get_dynamodb_resource", broken_resource)
+        with pytest.raises(ValueError):
+            repository.add(
+                Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+            )
+        monkeypatch.undo()
+
+        task = Task.create(uuid.uuid4(), "Clean your room", "john@doe.com")
+        repository.add(task)
+    finally:
+        write_coalescer.close()
+
+    assert repository.get_by_id(task_id=task.id, owner=task.owner) == task
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_coalescer_rejects_writes_after_thread_died(dynamodb_table):
+    """
+    Test function: test_coalescer_rejects_writes_after_thread_died
+
+    This test function verifies that pending writes fail and new writes are refused once the batching thread died.
+
+    Steps:
+    1. Create a write coalescer whose batch collection raises.
+    2. Perform an assertion to check if the submitted write fails instead of waiting forever.
+    3. Perform an assertion to check if submitting another item raises RuntimeError.
+    """
+    write_coalescer = BrokenWriteCoalescer(dynamodb_table, window_ms=1)
+    item = TaskStore._to_item(
+        Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+    )
+
+    with pytest.raises(RuntimeError):
+        write_coalescer.submit(item).result(timeout=1)
+    write_coalescer._thread.join(timeout=1)
+
+    with pytest.raises(RuntimeError):
+        write_coalescer.submit(item)
+    write_coalescer.close()
+
+
+def test_coalescer_resends_unprocessed_items(dynamodb_table):
+    """
+    Test function: test_coalescer_resends_unprocessed_items
+
+    This test function verifies that items returned as UnprocessedItems are resent and resolved only once written.
+
+    Steps:
+    1. Create a write coalescer whose first BatchWriteItem call leaves two of four items unprocessed.
+    2. Submit four items and record whether each item was written when its future resolved.
+    3. Perform assertions to check if only the unprocessed items were resent.
+    4. Perform an assertion to check if every future resolved after its own item was written.
+    """
+    write_coalescer = UnprocessedItemsCoalescer(
+        dynamodb_table, window_ms=50, unprocessed_count=2
+    )
+    items = [
+        TaskStore._to_item(Task.create(uuid.uuid4(), f"Task {index}", "john@doe.com"))
+        for index in range(4)
+    ]
+    written_when_resolved = {}
+
+    def record_resolution(key):
+        def callback(future):
+            written_when_resolved[key] = key in write_coalescer.written_keys
+
+        return callback
+
+    futures = []
+    for item in items:
+        future = write_coalescer.submit(item)
+        future.add_done_callback(record_resolution((item["PK"], item["SK"])))
+        futures.append(future)
+    try:
+        for future in futures:
+            future.result(timeout=5)
+    finally:
+        write_coalescer.close()
+
+    assert [len(request) for request in write_coalescer.requests] == [4, 2]
+    assert write_coalescer.requests[1] == items[2:]
+    assert written_when_resolved == {(item["PK"], item["SK"]): True for item in items}
+
+
+def test_coalescer_unprocessed_items_return_503(dynamodb_table, id_token):
+    """
+    Test function: test_coalescer_unprocessed_items_return_503
+
+    This test function verifies that items DynamoDB keeps returning as unprocessed end in HTTP 503.
+
+    Steps:
+    1. Create a write coalescer whose BatchWriteItem calls always leave the item unprocessed.
+    2. Override the get_task_store dependency with a TaskStore writing through it.
+    3. Send a POST request to the '/api/create-task/' endpoint.
+    4. Perform assertions to check if the response is HTTP 503 (Service Unavailable) with Retry-After
+       after every resend was made.
+    """
+    write_coalescer = UnprocessedItemsCoalescer(
+        dynamodb_table, window_ms=1, unprocessed_calls=MAX_UNPROCESSED_RETRIES + 1
+    )
+    app.dependency_overrides[get_task_store] = lambda: TaskStore(
+        table_name=dynamodb_table, write_coalescer=write_coalescer
+    )
+    try:
+        response = TestClient(app).post(
+            "/api/create-task/",
+            json={"title": "Clean your desk"},
+            headers={"Authorization": id_token},
+        )
+    finally:
+        del app.dependency_overrides[get_task_store]
+        write_coalescer.close()
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+    assert len(write_coalescer.requests) == MAX_UNPROCESSED_RETRIES + 1
+
+
+def test_throttled_write_retried(dynamodb_table):
+    """
+    Test function: test_throttled_write_retried
+
+    This test function verifies that throttled DynamoDB calls are retried with backoff.
+
+    Steps:
+    1. Create an instance of the TaskStore repository with a call guard allowing three attempts.
+    2. Inject two ProvisionedThroughputExceededException faults for PutItem.
+    3. Add a task to the repository.
+    4. Perform an assertion to check if both faults were consumed and the task was stored.
+    """
+    repository = TaskStore(
+        table_name=dynamodb_table,
+        call_guard=DynamoDBCallGuard(
+            retry_policy=RetryPolicy(max_attempts=3, base_delay_ms=1, max_delay_ms=5)
+        ),
+    )
+    task = Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+
+    with inject_dynamodb_faults(
+        repository, "PutItem", "ProvisionedThroughputExceededException", count=2
+    ) as faults:
+        repository.add(task)
+
+    assert faults["remaining"] == 0
+    assert repository.get_by_id(task_id=task.id, owner=task.owner) == task
+
+
+def test_retry_budget_limits_retries(dynamodb_table):
+    """
+    Test function: test_retry_budget_limits_retries
+
+    This test function verifies that retries stop once the retry budget is spent.
+
+    Steps:
+    1. Create an instance of the TaskStore repository with a retry budget of a single token.
+    2. Inject three ProvisionedThroughputExceededException faults for PutItem.
+    3. Perform an assertion to check if adding a task raises ServiceUnavailableError.
+    4. Perform an assertion to check if only one retry was made.
+    """
+    repository = TaskStore(
+        table_name=dynamodb_table,
+        call_guard=DynamoDBCallGuard(
+            retry_policy=RetryPolicy(
+                max_attempts=5, base_delay_ms=1, max_delay_ms=5, budget_tokens=1
+            )
+        ),
+    )
+    task = Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+
+    with inject_dynamodb_faults(
+        repository, "PutItem", "ProvisionedThroughputExceededException", count=3
+    ) as faults:
+        with pytest.raises(ServiceUnavailableError):
+            repository.add(task)
+
+    assert faults["remaining"] == 1
+
+
+def test_circuit_breaker_sheds_load(dynamodb_table, id_token):
+    """
+    Test function: test_circuit_breaker_sheds_load
+
+    This test function verifies that the API answers with 503 and Retry-After once the circuit breaker opens.
+
+    Steps:
+    1. Override the get_task_store dependency with a TaskStore whose circuit breaker opens after two failed calls.
+    2. Inject ProvisionedThroughputExceededException faults for PutItem.
+    3. Send two POST requests to the '/api/create-task/' endpoint which fail on DynamoDB throttling.
+    4. Send a third POST request while the circuit breaker is open.
+    5. Perform assertions to verify the expected behavior:
+        - Check that every response status code is HTTP 503 (Service Unavailable) with a Retry-After header.
+        - Check that the third request did not reach DynamoDB.
+    """
+    circuit_breaker = CircuitBreaker(
+        failure_rate_threshold=0.5, minimum_calls=2, reset_timeout_seconds=30
+    )
+    repository = TaskStore(
+        table_name=dynamodb_table,
+        call_guard=DynamoDBCallGuard(
+            retry_policy=RetryPolicy(max_attempts=1), circuit_breaker=circuit_breaker
+        ),
+    )
+    app.dependency_overrides[get_task_store] = lambda: repository
+    client = TestClient(app)
+
+    with inject_dynamodb_faults(
+        repository, "PutItem", "ProvisionedThroughputExceededException", count=3
+    ) as faults:
+        responses = [
+            client.post(
+                "/api/create-task/",
+                json={"title": "Clean your desk"},
+                headers={"Authorization": id_token},
+            )
+            for _ in range(3)
+        ]
+
+    for response in responses:
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert int(response.headers["Retry-After"]) >= 1
+    assert circuit_breaker.state == CircuitBreaker.OPEN
+    assert faults["remaining"] == 1
+
+
+def test_circuit_breaker_recovers_after_reset_timeout():
+    """
+    Test function: test_circuit_breaker_recovers_after_reset_timeout
+
+    This test function verifies that an open circuit breaker lets one probe through after the reset timeout.
+
+    Steps:
+    1. Create a CircuitBreaker with a fake clock and open it with failed calls.
+    2. Perform an assertion to check if calls are rejected while the circuit is open.
+    3. Move the clock past the reset timeout and perform an assertion to check if a single probe is allowed.
+    4. Record a successful probe and perform an assertion to check if the circuit is closed again.
+    """
+    now = [0.0]
+    circuit_breaker = CircuitBreaker(
+        minimum_calls=2, reset_timeout_seconds=5, clock=lambda: now[0]
+    )
+    circuit_breaker.record_failure()
+    circuit_breaker.record_failure()
+
+    with pytest.raises(ServiceUnavailableError):
+        circuit_breaker.before_call()
+
+    now[0] = 6.0
+    circuit_breaker.before_call()
+    assert circuit_breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(ServiceUnavailableError):
+        circuit_breaker.before_call()
+
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_backend_task_retrieved_by_id(any_task_store):
+    """
+    Test function: test_backend_task_retrieved_by_id
+
+    This test function verifies that every storage backend returns an added task by its ID.
+
+    Steps:
+    1. Create a task with a random UUID, title, and owner email and add it to the store.
+    2. Close the original task instance without adding it again.
+    3. Perform an assertion to check if the stored task is still open.
+    4. Perform an assertion to check if retrieving an unknown task raises KeyError.
+    """
+    task = Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+    any_task_store.add(task)
+    task.close()
+
+    assert any_task_store.get_by_id(task_id=task.id, owner=task.owner).status == (
+        TaskStatus.OPEN
+    )
+    with pytest.raises(KeyError):
+        any_task_store.get_by_id(task_id=uuid.uuid4(), owner=task.owner)
+
+
+def test_backend_lists_tasks_by_owner_and_status(any_task_store):
+    """
+    Test function: test_backend_lists_tasks_by_owner_and_status
+
+    This test function verifies that every storage backend lists tasks per owner and status in write order.
+
+    Steps:
+    1. Add two open tasks for one owner and an open task for another owner.
+    2. Close the first task and add it again.
+    3. Perform assertions to check if open and closed tasks are listed for the owner only.
+    """
+    first = Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+    second = Task.create(uuid.uuid4(), "Clean your room", "john@doe.com")
+    other = Task.create(uuid.uuid4(), "Clean your desk", "rex@mail.ru")
+    for task in (first, second, other):
+        any_task_store.add(task)
+
+    first.close()
+    any_task_store.add(first)
+
+    assert any_task_store.list_open(owner="john@doe.com") == [second]
+    assert any_task_store.list_closed(owner="john@doe.com") == [first]
+    assert any_task_store.list_open(owner="rex@mail.ru") == [other]
+
+
+def test_api_with_in_memory_backend(user_email, id_token):
+    """
+    Test function: test_api_with_in_memory_backend
+
+    This test function verifies that the API works without DynamoDB on the in-memory backend.
+
+    Steps:
+    1. Override the get_task_store dependency with an InMemoryTaskStore.
+    2. Create a task and close it via the API.
+    3. Perform an assertion to check if the task is listed by the '/api/closed-tasks/' endpoint.
+    """
+    task_store = InMemoryTaskStore()
+    app.dependency_overrides[get_task_store] = lambda: task_store
+    client = TestClient(app)
+
+    response = client.post(
+        "/api/create-task/",
+        json={"title": "Clean your desk"},
+        headers={"Authorization": id_token},
+    )
+    client.post(
+        "/api/close-task/",
+        json={"id": response.json()["id"]},
+        headers={"Authorization": id_token},
+    )
+    response = client.get("/api/closed-tasks/", headers={"Authorization": id_token})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [task["owner"] for task in response.json()["results"]] == [user_email]
+
+
+def test_sampled_request_profiled(id_token, tmp_path):
+    """
+    Test function: test_sampled_request_profiled
+
+    This test function verifies that sampled requests write a timing breakdown and a flamegraph file.
+
+    Steps:
+    1. Create a test client with ProfilingMiddleware sampling every request into a temporary directory.
+    2. Send a POST request to the '/api/create-task/' endpoint.
+    3. Perform assertions to verify the expected behavior:
+        - Check that one collapsed stack file and one summary file were written.
+        - Check that the summary contains timings for dependencies, store calls, endpoint and serialisation.
+    """
+    client = create_profiled_client(
+        InMemoryTaskStore(), sample_rate=1.0, slow_request_ms=None, output_dir=tmp_path
+    )
+
+    response = client.post(
+        "/api/create-task/",
+        json={"title": "Clean your desk"},
+        headers={"Authorization": id_token},
+    )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(list(tmp_path.glob("*.folded"))) == 1
+    (summary_path,) = tmp_path.glob("*.json")
+    summary = json.loads(summary_path.read_text())
+    assert summary["path"] == "/api/create-task/"
+    assert set(summary["timings_ms"]) == {
+        "dependency.get_user_email",
+        "store.add",
+        "endpoint",
+        "serialize_response",
+    }
+
+
+def test_slow_request_profiled(id_token, tmp_path):
+    """
+    Test function: test_slow_request_profiled
+
+    This test function verifies that requests over the slow request threshold are profiled even when not sampled.
+
+    Steps:
+    1. Create a test client with ProfilingMiddleware which samples no request but profiles requests over 20 ms.
+    2. Send a GET request to the '/api/open-tasks/' endpoint which is fast.
+    3. Send a POST request to the '/api/create-task/' endpoint whose store call takes 50 ms.
+    4. Perform assertions to verify the expected behavior:
+        - Check that only the slow request was written.
+        - Check that the stack samples contain the slow store call.
+    """
+    client = create_profiled_client(
+        SlowTaskStore(),
+        sample_rate=0.0,
+        slow_request_ms=20,
+        interval_ms=1,
+        output_dir=tmp_path,
+    )
+
+    client.get("/api/open-tasks/", headers={"Authorization": id_token})
+    client.post(
+        "/api/create-task/",
+        json={"title": "Clean your desk"},
+        headers={"Authorization": id_token},
+    )
+
+    (folded_path,) = tmp_path.glob("*.folded")
+    assert "api_create_task" in folded_path.name
+    assert "add (tests.py" in folded_path.read_text()
+
+
+def test_profile_write_failure_keeps_response(id_token, tmp_path, caplog):
+    """
+    Test function: test_profile_write_failure_keeps_response
+
+    This test function verifies that a profile which cannot be written does not fail the profiled request.
+
+    Steps:
+    1. Create a test client with ProfilingMiddleware sampling every request into a directory below a regular file.
+    2. Send a POST request to the '/api/create-task/' endpoint.
+    3. Perform assertions to check if the task was created and the write error was logged.
+    """
+    not_a_directory = tmp_path / "profiles"
+    not_a_directory.write_text("")
+    client = create_profiled_client(
+        InMemoryTaskStore(),
+        sample_rate=1.0,
+        slow_request_ms=None,
+        output_dir=not_a_directory / "nested",
+    )
+
+    with caplog.at_level("ERROR", logger="tasks_api.profiling"):
+        response = client.post(
+            "/api/create-task/",
+            json={"title": "Clean your desk"},
+            headers={"Authorization": id_token},
+        )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert "could not be written" in caplog.text
+
+
+def test_stack_sampling_starts_after_delay():
+    """
+    Test function: test_stack_sampling_starts_after_delay
+
+    This test function verifies that stacks of a request registered with a delay are only sampled once it passed.
+
+    Steps:
+    1. Register a profile of the current thread with a StackSampler sampling every millisecond after 200 ms.
+    2. Perform an assertion to check if no stack was sampled within the first 50 ms.
+    3. Perform an assertion to check if stacks were sampled once the delay passed.
+    """
+    profile = RequestProfile("GET", "/api/open-tasks/", capture_stacks=True)
+    profile.enter_thread()
+    sampler = StackSampler(interval_ms=1)
+    sampler.register(profile, delay=0.2)
+
+    time.sleep(0.05)
+    samples_before_delay = sum(profile.samples.values())
+    time.sleep(0.25)
+    sampler.unregister(profile)
+    profile.exit_thread()
+
+    assert samples_before_delay == 0
+    assert sum(profile.samples.values()) > 0
+
+
+def test_timed_task_store_times_transaction_commit():
+    """
+    Test function: test_timed_task_store_times_transaction_commit
+
+    This test function verifies that committing a transaction through TimedTaskStore is reported to the profile.
+
+    Steps:
+    1. Create a TimedTaskStore for an in-memory store and a request profile of the current context.
+    2. Put a task in a transaction of the TimedTaskStore.
+    3. Perform assertions to check if the commit was timed and the task was stored.
+    """
+    task_store = InMemoryTaskStore()
+    profile = RequestProfile("POST", "/api/create-task/", capture_stacks=False)
+    task = Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+
+    def commit():
+        with TimedTaskStore(task_store).transaction() as transaction:
+            transaction.put(task)
+
+    context = contextvars.copy_context()
+    context.run(_current_profile.set, profile)
+    context.run(commit)
+
+    assert profile.calls["store.transaction"] == 1
+    assert task_store.get_by_id(task_id=task.id, owner=task.owner) == task
+
+
+def test_task_store_warm_up(dynamodb_table):
+    """
+    Test function: test_task_store_warm_up
+
+    This test function verifies that warming up a worker opens a connection to its DynamoDB table.
+
+    Steps:
+    1. Create an instance of the TaskStore repository and warm it up.
+    2. Perform an assertion to check if warming up a TaskStore for a missing table raises ClientError.
+    """
+    TaskStore(table_name=dynamodb_table).warm_up()
+
+    with pytest.raises(ClientError):
+        TaskStore(table_name="missing-table").warm_up()
+
+
+def test_rate_limit_per_owner(client, id_token):
+    """
+    Test function: test_rate_limit_per_owner
+
+    This test function verifies that owners who use up their token bucket get 429 without affecting other owners.
+
+    Steps:
+    1. Override the get_rate_limiter dependency with an in-memory limiter allowing a burst of two task creations.
+    2. Send three POST requests to the '/api/create-task/' endpoint as the same owner.
+    3. Send a POST request to the '/api/create-task/' endpoint as another owner.
+    4. Perform assertions to verify the expected behavior:
+        - Check that the first two requests succeed and the third one returns HTTP 429 with a Retry-After header.
+        - Check that the other owner is not limited.
+        - Check that endpoints without a configured limit are not limited.
+    """
+    rate_limiter = RateLimiter(InMemoryRateLimitBackend(), {"create_task": (0.1, 2)})
+    app.dependency_overrides[get_rate_limiter] = lambda: rate_limiter
+    other_token = jwt.encode(
+        {"cognito:username": "rex@mail.ru"}, load_env(key="SECRET_KEY_TEST", cast=str)
+    )
+
+    try:
+        responses = [
+            client.post(
+                "/api/create-task/",
+                json={"title": "Clean your desk"},
+                headers={"Authorization": id_token},
+            )
+            for _ in range(3)
+        ]
+        other_response = client.post(
+            "/api/create-task/",
+            json={"title": "Clean your desk"},
+            headers={"Authorization": other_token},
+        )
+        open_response = client.get(
+            "/api/open-tasks/", headers={"Authorization": id_token}
+        )
+    finally:
+        del app.dependency_overrides[get_rate_limiter]
+
+    assert [response.status_code for response in responses] == [
+        status.HTTP_201_CREATED,
+        status.HTTP_201_CREATED,
+        status.HTTP_429_TOO_MANY_REQUESTS,
+    ]
+    assert responses[2].headers["Retry-After"] == "10"
+    assert other_response.status_code == status.HTTP_201_CREATED
+    assert open_response.status_code == status.HTTP_200_OK
+
+
+def test_in_memory_rate_limit_refills():
+    """
+    Test function: test_in_memory_rate_limit_refills
+
+    This test function verifies that token buckets refill over time.
+
+    Steps:
+    1. Create an InMemoryRateLimitBackend with a fake clock and use up a bucket of one token.
+    2. Perform an assertion to check if the next request has to wait half a second.
+    3. Move the clock half a second forward and perform an assertion to check if a token is available again.
+    """
+    now = [0.0]
+    backend = InMemoryRateLimitBackend(clock=lambda: now[0])
+
+    assert backend.acquire(("john@doe.com", "create_task"), rate=2, burst=1) == 0
+    assert backend.acquire(("john@doe.com", "create_task"), rate=2, burst=1) == 0.5
+
+    now[0] = 0.5
+    assert backend.acquire(("john@doe.com", "create_task"), rate=2, burst=1) == 0
+
+
+def test_dynamodb_rate_limit_shared_between_workers(dynamodb_table):
+    """
+    Test function: test_dynamodb_rate_limit_shared_between_workers
+
+    This test function verifies that the DynamoDB backend shares token buckets between limiter instances.
+
+    Steps:
+    1. Create two DynamoDBRateLimitBackend instances on the dynamodb_table fixture with the same fake clock.
+    2. Take the two tokens of a bucket, one through each instance.
+    3. Perform an assertion to check if the next request through either instance has to wait.
+    4. Perform an assertion to check if rate limit items are not listed as tasks.
+    """
+    now = [1000.0]
+    first = DynamoDBRateLimitBackend(dynamodb_table, clock=lambda: now[0])
+    second = DynamoDBRateLimitBackend(dynamodb_table, clock=lambda: now[0])
+    key = ("john@doe.com", "create_task")
+
+    assert first.acquire(key, rate=1, burst=2) == 0
+    assert second.acquire(key, rate=1, burst=2) == 0
+    assert first.acquire(key, rate=1, burst=2) == 1
+    assert second.acquire(key, rate=1, burst=2) == 1
+    assert TaskStore(dynamodb_table).list_open(owner="john@doe.com") == []
+
+
+def test_dynamodb_rate_limit_fails_open_on_contention(dynamodb_table):
+    """
+    Test function: test_dynamodb_rate_limit_fails_open_on_contention
+
+    This test function verifies that a bucket contended by other workers does not reject the request.
+
+    Steps:
+    1. Create a DynamoDBRateLimitBackend on the dynamodb_table fixture with a full bucket.
+    2. Inject a ConditionalCheckFailedException fault for every conditional PutItem attempt.
+    3. Perform an assertion to check if the request does not have to wait.
+    """
+    backend = DynamoDBRateLimitBackend(dynamodb_table)
+
+    with inject_dynamodb_faults(
+        TaskStore(dynamodb_table),
+        "PutItem",
+        "ConditionalCheckFailedException",
+        count=MAX_CONDITIONAL_WRITE_RETRIES,
+    ) as faults:
+        retry_after = backend.acquire(("john@doe.com", "create_task"), rate=1, burst=2)
+
+    assert faults["remaining"] == 0
+    assert retry_after == 0
+
+
+def test_dynamodb_rate_limit_uses_call_guard(dynamodb_table):
+    """
+    Test function: test_dynamodb_rate_limit_uses_call_guard
+
+    This test function verifies that the DynamoDB backend retries via the call guard and fails open once it gives up.
+
+    Steps:
+    1. Create a RateLimiter on a DynamoDBRateLimitBackend with a call guard allowing two attempts.
+    2. Inject five ProvisionedThroughputExceededException faults for GetItem.
+    3. Perform an assertion to check if the request is not rejected.
+    4. Perform an assertion to check if only the two attempts of the call guard were made.
+    """
+    call_guard = DynamoDBCallGuard(
+        retry_policy=RetryPolicy(max_attempts=2, base_delay_ms=1, max_delay_ms=5)
+    )
+    rate_limiter = RateLimiter(
+        DynamoDBRateLimitBackend(dynamodb_table, call_guard=call_guard),
+        {"create_task": (1, 2)},
+    )
+
+    with inject_dynamodb_faults(
+        TaskStore(dynamodb_table, call_guard=call_guard),
+        "GetItem",
+        "ProvisionedThroughputExceededException",
+        count=5,
+    ) as faults:
+        rate_limiter.check(owner="john@doe.com", endpoint="create_task")
+
+    assert faults["remaining"] == 3
+
+
+def test_rate_limit_unavailable_warning_throttled(caplog):
+    """
+    Test function: test_rate_limit_unavailable_warning_throttled
+
+    This test function verifies that an unavailable rate limit backend is logged once per interval without traceback.
+
+    Steps:
+    1. Create a RateLimiter with a fake clock on a backend which raises ServiceUnavailableError.
+    2. Check three requests, then advance the clock past the warning interval and check one more.
+    3. Perform assertions to check if requests were let through and only two warnings without traceback were logged.
+    """
+    now = [0.0]
+
+    class UnavailableBackend:
+        def acquire(self, key, rate, burst):
+            raise ServiceUnavailableError("DynamoDB circuit breaker is open", 5)
+
+    rate_limiter = RateLimiter(
+        UnavailableBackend(), {"create_task": (1, 2)}, clock=lambda: now[0]
+    )
+
+    with caplog.at_level("WARNING", logger="tasks_api.ratelimit"):
+        for _ in range(3):
+            rate_limiter.check(owner="john@doe.com", endpoint="create_task")
+        now[0] = UNAVAILABLE_WARNING_INTERVAL_SECONDS
+        rate_limiter.check(owner="john@doe.com", endpoint="create_task")
+
+    assert len(caplog.records) == 2
+    assert all(record.exc_info is None for record in caplog.records)
+    assert "2 similar warnings suppressed" in caplog.records[1].getMessage()
+
+
+def test_dynamodb_resource_cached_per_thread_and_config(dynamodb_table):
+    """
+    Test function: test_dynamodb_resource_cached_per_thread_and_config
+
+    This test function verifies that DynamoDB resources are reused within a thread but never shared between threads
+    or between configs which differ in any option.
+
+    Steps:
+    1. Get the DynamoDB resource twice in the test thread and once in another thread.
+    2. Get DynamoDB resources for two configs with the same retries but different read timeouts.
+    3. Perform assertions to check if only the resources of the same thread and config are the same object.
+    """
+    resource = get_dynamodb_resource()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other_thread_resource = executor.submit(get_dynamodb_resource).result()
+    retries = {"mode": "standard", "total_max_attempts": 1}
+
+    assert get_dynamodb_resource() is resource
+    assert other_thread_resource is not resource
+    assert get_dynamodb_resource(
+        config=BotocoreConfig(retries=retries, read_timeout=1)
+    ) is not get_dynamodb_resource(
+        config=BotocoreConfig(retries=retries, read_timeout=2)
+    )
+    assert get_dynamodb_resource(
+        config=BotocoreConfig(retries=retries, read_timeout=1)
+    ) is get_dynamodb_resource(config=BotocoreConfig(retries=retries, read_timeout=1))
+
+
+def test_worker_respawn_backs_off():
+    """
+    Test function: test_worker_respawn_backs_off
+
+    This test function verifies that workers which keep exiting right after start are replaced with growing delays.
+
+    Steps:
+    1. Compute the respawn delay for a growing number of workers in a row which exited right after start.
+    2. Perform assertions to check if the delay doubles from one second and is capped.
+    """
+    assert [respawn_delay(failures) for failures in range(4)] == [0, 1, 2, 4]
+    assert respawn_delay(100) == MAX_RESPAWN_DELAY_SECONDS
+
+
+def test_snapshot_restores_seed_data(dynamodb_table, dynamodb_snapshot):
+    """
+    Test function: test_snapshot_restores_seed_data
+
+    This test function verifies that restoring the snapshot undoes added, changed and deleted items.
+
+    Steps:
+    1. Add a new task, close a seed task and delete another seed task.
+    2. Restore the snapshot.
+    3. Perform assertions to check if the new task is gone and the seed tasks are back to their seeded state.
+    """
+    repository = TaskStore(table_name=dynamodb_table)
+    repository.add(Task.create(uuid.uuid4(), "Clean your office", "seed@builder.com"))
+    closed_seed = Task(**{**vars(SEED_TASKS[0]), "status": TaskStatus.CLOSED})
+    repository.add(closed_seed)
+    dynamodb_snapshot.table.delete_item(
+        Key={"PK": f"#{SEED_TASKS[1].owner}", "SK": f"#{SEED_TASKS[1].id}"}
+    )
+
+    dynamodb_snapshot.restore()
+
+    assert repository.list_open(owner="seed@builder.com") == SEED_TASKS
+    assert repository.list_closed(owner="seed@builder.com") == []
+
+
+def test_list_open_tasks_large_dataset(perf_dynamodb_table):
+    """
+    Test function: test_list_open_tasks_large_dataset
+
+    This test function verifies that listing tasks follows DynamoDB pagination on the large seeded dataset.
+
+    Steps:
+    1. Create an instance of the TaskStore repository on the perf_dynamodb_table fixture.
+    2. Limit every Query to 100 items so the result is returned in several pages.
+    3. Perform assertions to check if every open and closed task of the owner is listed.
+    """
+    repository = TaskStore(table_name=perf_dynamodb_table)
+    events = repository._table().meta.client.meta.events
+    event_name = "provide-client-params.dynamodb.Query"
+
+    pages = []
+
+    def limit_page_size(params, **kwargs):
+        pages.append(params.get("ExclusiveStartKey"))
+        return {**params, "Limit": 100}
+
+    events.register(event_name, limit_page_size)
+    try:
+        open_tasks = repository.list_open(owner=PERF_OWNER)
+        closed_tasks = repository.list_closed(owner=PERF_OWNER)
+    finally:
+        events.unregister(event_name, limit_page_size)
+
+    assert len(pages) == PERF_DATASET_SIZE // 100  # 10 pages per status
+    assert len(open_tasks) == PERF_DATASET_SIZE // 2
+    assert len(closed_tasks) == PERF_DATASET_SIZE // 2
+    assert {task.status for task in open_tasks} == {TaskStatus.OPEN}
+
+
+def test_transaction_commits_all_operations(any_task_store):
+    """
+    Test function: test_transaction_commits_all_operations
+
+    This test function verifies that every storage backend commits the operations of a transaction together.
+
+    Steps:
+    1. Add an open task to the store.
+    2. In one transaction, close the task only if it is open and create a second task only if it does not exist.
+    3. Perform assertions to check if the first task is closed and the second task is listed as open.
+    """
+    first = Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+    second = Task.create(uuid.uuid4(), "Clean your room", "john@doe.com")
+    any_task_store.add(first)
+
+    with any_task_store.transaction() as transaction:
+        transaction.update_status(
+            first.id,
+            first.owner,
+            TaskStatus.CLOSED,
+            expected_status=TaskStatus.OPEN,
+        )
+        transaction.put(second, must_exist=False)
+
+    assert any_task_store.get_by_id(task_id=first.id, owner=first.owner).status == (
+        TaskStatus.CLOSED
+    )
+    assert any_task_store.list_open(owner="john@doe.com") == [second]
+
+
+def test_transaction_cancelled_on_failed_condition(any_task_store):
+    """
+    Test function: test_transaction_cancelled_on_failed_condition
+
+    This test function verifies that a failed condition cancels the whole transaction on every storage backend.
+
+    Steps:
+    1. Add a closed task to the store.
+    2. In one transaction, create a new task and check that the closed task is still open.
+    3. Perform an assertion to check if TransactionConflictError names the failed condition check.
+    4. Perform an assertion to check if the new task was not created.
+    """
+    closed = Task(uuid.uuid4(), "Clean your office", TaskStatus.CLOSED, "john@doe.com")
+    new = Task.create(uuid.uuid4(), "Clean your room", "john@doe.com")
+    any_task_store.add(closed)
+
+    with pytest.raises(TransactionConflictError) as exc_info:
+        with any_task_store.transaction() as transaction:
+            transaction.put(new)
+            transaction.condition_check(
+                closed.id, closed.owner, expected_status=TaskStatus.OPEN
+            )
+
+    assert exc_info.value.reasons == ["None", "ConditionalCheckFailed"]
+    assert any_task_store.list_open(owner="john@doe.com") == []
+
+
+def test_transaction_rejects_same_task_twice(any_task_store):
+    """
+    Test function: test_transaction_rejects_same_task_twice
+
+    This test function verifies that a transaction cannot contain two operations on the same task.
+
+    Steps:
+    1. Put a task into a transaction.
+    2. Perform an assertion to check if updating the same task in the transaction raises ValueError.
+    """
+    task = Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+    transaction = any_task_store.transaction()
+    transaction.put(task)
+
+    with pytest.raises(ValueError):
+        transaction.update_status(task.id, task.owner, TaskStatus.CLOSED)
+
+
+def test_transaction_chunked_within_limits(dynamodb_table):
+    """
+    Test function: test_transaction_chunked_within_limits
+
+    This test function verifies that large transactions are split into TransactWriteItems calls within limits.
+
+    Steps:
+    1. Put one and a half times MAX_TRANSACTION_ITEMS tasks into a transaction on the DynamoDB store.
+    2. Count TransactWriteItems calls while the transaction is committed.
+    3. Perform assertions to check if two calls were made and every task was stored.
+    """
+    repository = TaskStore(table_name=dynamodb_table)
+    tasks = [
+        Task.create(uuid.uuid4(), f"Task {index}", "john@doe.com")
+        for index in range(MAX_TRANSACTION_ITEMS * 3 // 2)
+    ]
+    events = repository._table().meta.client.meta.events
+    event_name = "before-parameter-build.dynamodb.TransactWriteItems"
+    calls = []
+
+    def count_call(params, **kwargs):
+        calls.append(len(params["TransactItems"]))
+
+    events.register(event_name, count_call)
+    try:
+        with repository.transaction() as transaction:
+            for task in tasks:
+                transaction.put(task)
+    finally:
+        events.unregister(event_name, count_call)
+
+    assert calls == [MAX_TRANSACTION_ITEMS, MAX_TRANSACTION_ITEMS // 2]
+    assert len(repository.list_open(owner="john@doe.com")) == len(tasks)
+
+
+def test_transaction_retried_with_same_request_token(dynamodb_table):
+    """
+    Test function: test_transaction_retried_with_same_request_token
+
+    This test function verifies that a retried transaction reuses its idempotency token.
+
+    Steps:
+    1. Create an instance of the TaskStore repository with a call guard allowing three attempts.
+    2. Inject one ProvisionedThroughputExceededException fault for TransactWriteItems.
+    3. Record the ClientRequestToken of every TransactWriteItems attempt while a task is put in a transaction.
+    4. Perform assertions to check if both attempts sent the same token and the task was stored.
+    """
+    repository = TaskStore(
+        table_name=dynamodb_table,
+        call_guard=DynamoDBCallGuard(
+            retry_policy=RetryPolicy(max_attempts=3, base_delay_ms=1, max_delay_ms=5)
+        ),
+    )
+    task = Task.create(uuid.uuid4(), "Clean your office", "john@doe.com")
+    events = repository._table().meta.client.meta.events
+    event_name = "before-parameter-build.dynamodb.TransactWriteItems"
+    tokens = []
+
+    def record_token(params, **kwargs):
+        tokens.append(params["ClientRequestToken"])
+
+    events.register(event_name, record_token)
+    try:
+        with inject_dynamodb_faults(
+            repository,
+            "TransactWriteItems",
+            "ProvisionedThroughputExceededException",
+            count=1,
+        ):
+            with repository.transaction() as transaction:
+                transaction.put(task, must_exist=False)
+    finally:
+        events.unregister(event_name, record_token)
+
+    assert len(tokens) == 2
+    assert tokens[0] == tokens[1]
+    assert repository.get_by_id(task_id=task.id, owner=task.owner) == task
+
+
+def test_transaction_conflict_returns_409(id_token):
+    """
+    Test function: test_transaction_conflict_returns_409
+
+    This test function verifies that cancelled transactions are returned as HTTP 409 with the cancellation reasons.
+
+    Steps:
+    1. Override the get_task_store dependency with a store which only replaces existing tasks in a transaction.
+    2. Send a POST request to the '/api/create-task/' endpoint.
+    3. Perform assertions to check if the response status code is HTTP 409 (Conflict) with the reasons.
+    """
+    app.dependency_overrides[get_task_store] = lambda: ConflictingTaskStore()
+    client = TestClient(app)
+
+    response = client.post(
+        "/api/create-task/",
+        json={"title": "Clean your desk"},
+        headers={"Authorization": id_token},
+    )
+
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.json()["reasons"] == ["ConditionalCheckFailed"]